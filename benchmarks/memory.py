@@ -0,0 +1,80 @@
+"""
+Memory used by the users and channels state of a synthetic server.
+
+    python benchmarks/memory.py --users 3000 --channels 300 --comment-size 512
+
+Channels and users are fed to a client that is not connected, as the server would send them during the
+synchronization. The Python heap is measured with tracemalloc: blobs kept in the SQLite database are outside of it, so
+the peak resident size of the process is reported too.
+"""
+from __future__ import annotations
+
+import argparse
+import resource
+import tracemalloc
+from random import Random
+
+from pymumble_typed.mumble import Mumble
+from pymumble_typed.protobuf.Mumble_pb2 import ChannelState, UserState
+
+
+def channel_packets(channels: int, rng: Random, description_size: int) -> list[ChannelState]:
+    packets = [ChannelState(channel_id=0, name="Root")]
+    for channel_id in range(1, channels):
+        packet = ChannelState(channel_id=channel_id, parent=rng.randrange(channel_id), name=f"Channel {channel_id}",
+                              position=rng.randrange(100))
+        if description_size:
+            packet.description = "d" * description_size
+        packets.append(packet)
+    return packets
+
+
+def user_packets(users: int, channels: int, rng: Random, comment_size: int, texture_size: int) -> list[UserState]:
+    packets = []
+    for session in range(1, users + 1):
+        packet = UserState(session=session, name=f"User {session}", channel_id=rng.randrange(channels),
+                           hash=f"{session:040x}", self_mute=rng.random() < 0.3)
+        if comment_size:
+            packet.comment = "c" * comment_size
+        if texture_size:
+            packet.texture = bytes(texture_size)
+        packets.append(packet)
+    return packets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=3000)
+    parser.add_argument("--channels", type=int, default=300)
+    parser.add_argument("--comment-size", type=int, default=0, help="bytes of comment of every user")
+    parser.add_argument("--texture-size", type=int, default=0, help="bytes of avatar of every user")
+    parser.add_argument("--description-size", type=int, default=0, help="bytes of description of every channel")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = Random(args.seed)
+    channels = channel_packets(args.channels, rng, args.description_size)
+    users = user_packets(args.users, args.channels, rng, args.comment_size, args.texture_size)
+    mumble = Mumble("localhost", "benchmark")
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for packet in channels:
+        mumble.channels.handle_update(packet)
+    channels_done = tracemalloc.take_snapshot()
+    for packet in users:
+        mumble.users.handle_update(packet)
+    users_done = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    channels_size = sum(stat.size_diff for stat in channels_done.compare_to(before, "filename"))
+    users_size = sum(stat.size_diff for stat in users_done.compare_to(channels_done, "filename"))
+    print(f"channels: {args.channels:>7}  heap {channels_size / 1024:10.1f} KiB  "
+          f"{channels_size / max(args.channels, 1):8.1f} B/channel")
+    print(f"users:    {args.users:>7}  heap {users_size / 1024:10.1f} KiB  "
+          f"{users_size / max(args.users, 1):8.1f} B/user")
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
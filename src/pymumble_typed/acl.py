@@ -42,7 +42,8 @@ class ChannelACL:
         self.apply_here: bool = acl.apply_here
         self.apply_subs: bool = acl.apply_subs
         self.inherited: bool = acl.inherited
-        self.user_id: int = acl.user_id
+        # Entries for a group have no user, -1 keeps them from matching the SuperUser (0)
+        self.user_id: int = acl.user_id if acl.HasField("user_id") else -1
         self.group: str = acl.group
         self.grant: int = acl.grant
         self.deny: int = acl.deny
@@ -69,22 +70,27 @@ class ACL:
         self._mumble = mumble
         self._channel_id = channel_id
         self.inherit_acls = False
-        self.groups = {}
-        self.acls = {}
+        self.groups: dict[str, ChannelGroup] = {}
+        # Entries are evaluated in order, the inherited ones come first
+        self.acls: list[ChannelACL] = []
+        # Whether the ACL has been received from the server at least once
+        self.loaded = False
         self._lock = Lock()
 
     def update(self, packet: ACLPacket):
+        # Every ACL message carries the whole ACL of the channel, it replaces the previous one
         self._lock.acquire()
         self.inherit_acls = bool(packet.inherit_acls)
-        for group in packet.groups:
-            try:
-                self.groups[group.name].update(group)
-            except KeyError:
-                self.groups[group.name] = ChannelGroup(group)
-
-        for acl in packet.acls:
-            try:
-                self.acls[acl.group].update(acl)
-            except KeyError:
-                self.groups[acl.group] = ChannelACL(acl)
+        self.groups = {group.name: ChannelGroup(group) for group in packet.groups}
+        self.acls = [ChannelACL(acl) for acl in packet.acls]
+        self.loaded = True
         self._lock.release()
+        self._mumble.permissions.invalidate()
+
+    def members(self, name: str) -> set[int] | None:
+        """User ids in the group `name` of this channel, None when the channel has no such group"""
+        group = self.groups.get(name)
+        if group is None:
+            return None
+        members = set(group.inherited_members) if group.inherit else set()
+        return (members | set(group.add)) - set(group.remove)
@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from logging import Logger
+
+    from pymumble_typed.network.control import ControlStack
+    from pymumble_typed.prefetch import PrefetchPolicy
+
+from concurrent.futures import Future
+from enum import IntEnum
+from threading import Lock, current_thread
+from time import monotonic
+
+from pymumble_typed.commands import RequestBlobCmd
+from pymumble_typed.network.ping import RepeatTimer
+
+
+class BlobKind(IntEnum):
+    COMMENT = 0
+    TEXTURE = 1
+    DESCRIPTION = 2
+
+
+class BlobUnavailableError(Exception):
+    def __init__(self, kind: BlobKind, _id: int, reason: str):
+        self.kind = kind
+        self.id = _id
+        self.reason = reason
+
+    def __str__(self):
+        return f"{self.kind.name.lower()} of {self.id} is unavailable: {self.reason}"
+
+
+# Sizes assumed for a blob before it is received, the server does not tell them in advance
+ESTIMATED_SIZES = {BlobKind.COMMENT: 2048, BlobKind.TEXTURE: 65536, BlobKind.DESCRIPTION: 2048}
+
+
+def resolved(content: str | bytes) -> Future:
+    """Future already resolved with a blob that is stored and current"""
+    future = Future()
+    future.set_result(content)
+    return future
+
+
+class BlobRequestScheduler:
+    """
+    Gather the requests of user comments and textures and of channel descriptions, and send them together.
+
+    Requests are collected for `window` seconds and sent with a single RequestBlob. A blob already pending or requested
+    and not received yet is not asked again. Requests are sent while the estimated size of the blobs requested and not
+    received yet stays below `max_outstanding`, the estimate of each kind follows the sizes actually received. A blob
+    not received within `timeout` seconds is considered lost and can be asked again.
+
+    Blobs fetched with fetch() are resolved through a Future when they arrive, and asked again on timeout. They are
+    requested before any other, the others are prefetched in the order and within the budget of the PrefetchPolicy,
+    if one is set. Prefetching is background traffic, only sent while no other command is waiting to be sent.
+    """
+
+    def __init__(self, control: ControlStack, logger: Logger, window: float = 0.1, max_outstanding: int = 262144,
+                 timeout: float = 10.):
+        self._control = control
+        self._window = window
+        self._max_outstanding = max_outstanding
+        self._timeout = timeout
+        self._logger = logger.getChild(self.__class__.__name__)
+        self._lock = Lock()
+        # Insertion ordered, so that blobs are requested in the order they were asked
+        self._pending: dict[tuple[BlobKind, int], None] = {}
+        # Requested blobs with their estimated size, the time they are considered lost and whether they were prefetched
+        self._in_flight: dict[tuple[BlobKind, int], tuple[int, float, bool]] = {}
+        self._outstanding = 0
+        self._estimates = dict(ESTIMATED_SIZES)
+        self._waiters: dict[tuple[BlobKind, int], list[Future]] = {}
+        self._policy: PrefetchPolicy | None = None
+        self._timer: RepeatTimer | None = None
+
+    def set_policy(self, policy: PrefetchPolicy | None):
+        self._policy = policy
+
+    def request_comment(self, session: int):
+        self.request(BlobKind.COMMENT, [session])
+
+    def request_texture(self, session: int):
+        self.request(BlobKind.TEXTURE, [session])
+
+    def request_description(self, channel_id: int):
+        self.request(BlobKind.DESCRIPTION, [channel_id])
+
+    def request(self, kind: BlobKind, ids: Iterable[int]):
+        with self._lock:
+            for _id in ids:
+                key = kind, _id
+                if key not in self._in_flight:
+                    self._pending[key] = None
+            if self._pending and self._timer is None:
+                self._timer = RepeatTimer(self._window, self.flush)
+                self._timer.start()
+
+    def fetch(self, kind: BlobKind, _id: int) -> Future:
+        """Request the blob, the returned Future is resolved with its content when it arrives"""
+        future = Future()
+        with self._lock:
+            self._waiters.setdefault((kind, _id), []).append(future)
+        self.request(kind, [_id])
+        return future
+
+    def received(self, kind: BlobKind, _id: int, content: str | bytes):
+        with self._lock:
+            self._pending.pop((kind, _id), None)
+            entry = self._complete((kind, _id))
+            if entry is not None:
+                size = len(content.encode() if isinstance(content, str) else content)
+                # Moving average, so that a single big blob does not stop the requests
+                self._estimates[kind] = (3 * self._estimates[kind] + size) // 4
+                if entry[2] and self._policy is not None:
+                    self._policy.credit(entry[0] - size)
+            waiters = self._waiters.pop((kind, _id), [])
+        for future in waiters:
+            # Futures cancelled by their caller, like through asyncio.wrap_future, are skipped
+            if future.set_running_or_notify_cancel():
+                future.set_result(content)
+
+    def forget_user(self, session: int):
+        self._forget([(BlobKind.COMMENT, session), (BlobKind.TEXTURE, session)], "the user left")
+
+    def forget_channel(self, channel_id: int):
+        self._forget([(BlobKind.DESCRIPTION, channel_id)], "the channel was removed")
+
+    def _forget(self, keys: Iterable[tuple[BlobKind, int]], reason: str):
+        failed = []
+        with self._lock:
+            for key in keys:
+                self._pending.pop(key, None)
+                self._complete(key)
+                failed += [(key, future) for future in self._waiters.pop(key, [])]
+        for (kind, _id), future in failed:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(BlobUnavailableError(kind, _id, reason))
+
+    def _complete(self, key: tuple[BlobKind, int]) -> tuple[int, float, bool] | None:
+        entry = self._in_flight.pop(key, None)
+        if entry is not None:
+            self._outstanding -= entry[0]
+        return entry
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @property
+    def outstanding(self) -> int:
+        """Estimated bytes of the blobs requested and not received yet"""
+        return self._outstanding
+
+    def flush(self):
+        """Send the pending requests that fit, called every window"""
+        # An exception would end the timer and no blob would ever be requested again
+        try:
+            self._flush()
+        except Exception:
+            self._logger.error("Error while requesting blobs", exc_info=True)
+        with self._lock:
+            # Nothing left to send or to wait for: the timer is started again by the next request
+            if not self._pending and not self._in_flight and self._timer is current_thread():
+                self._timer.cancel()
+                self._timer = None
+
+    def _flush(self):
+        with self._lock:
+            now = monotonic()
+            # Blobs nobody waits for anymore are only prefetched
+            self._waiters = {key: futures for key, futures in self._waiters.items()
+                             if any(not future.cancelled() for future in futures)}
+            for key, (_, deadline, _) in list(self._in_flight.items()):
+                if deadline <= now:
+                    self._logger.debug(f"blob request timed out: {key[0].name} {key[1]}")
+                    self._complete(key)
+                    if key in self._waiters:
+                        self._pending[key] = None
+            if not self._pending:
+                return
+            # Fetched blobs are awaited, only prefetching waits for the other commands
+            busy = not self._control.msg_queue.empty()
+            batch: dict[BlobKind, list[int]] = {kind: [] for kind in BlobKind}
+            for key, prefetch in self._ordered(now):
+                if prefetch and busy:
+                    break
+                size = self._estimates[key[0]]
+                # One blob is always allowed, even if bigger than the limit, so that nothing is blocked forever
+                if self._in_flight and self._outstanding + size > self._max_outstanding:
+                    break
+                if prefetch and self._policy is not None:
+                    if not self._policy.available(now, size):
+                        break
+                    self._policy.consume(size)
+                del self._pending[key]
+                self._in_flight[key] = size, now + self._timeout, prefetch
+                self._outstanding += size
+                batch[key[0]].append(key[1])
+            if not any(batch.values()):
+                return
+        self._logger.debug(f"requesting blobs: comments {batch[BlobKind.COMMENT]}, "
+                           f"textures {batch[BlobKind.TEXTURE]}, descriptions {batch[BlobKind.DESCRIPTION]}")
+        self._control.send_command(RequestBlobCmd(user_comment_hashes=batch[BlobKind.COMMENT],
+                                                  user_texture_hashes=batch[BlobKind.TEXTURE],
+                                                  channel_comment_hashes=batch[BlobKind.DESCRIPTION]))
+
+    def _ordered(self, now: float) -> list[tuple[tuple[BlobKind, int], bool]]:
+        # Pending blobs in the order they are requested, flagged when they are prefetched
+        fetched = [(key, False) for key in self._pending if key in self._waiters]
+        prefetched = [key for key in self._pending if key not in self._waiters]
+        if self._policy is not None and prefetched:
+            if self._policy.paused(now):
+                return fetched
+            priorities = {key: self._policy.priority(*key, now) for key in prefetched}
+            # Sorting is stable: blobs with the same priority keep the order they were asked in
+            prefetched.sort(key=priorities.__getitem__)
+        return fetched + [(key, True) for key in prefetched]
+
+    def reset(self, reason: str = "the connection was reset"):
+        """Drop every request, for a new connection"""
+        with self._lock:
+            self._pending = {}
+            self._in_flight = {}
+            self._outstanding = 0
+            self._estimates = dict(ESTIMATED_SIZES)
+        self._forget(list(self._waiters), reason)
+
+    def stop(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        self.reset("the client stopped")
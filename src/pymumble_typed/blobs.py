@@ -9,6 +9,9 @@ import sqlite3
 from base64 import b64decode, b64encode
 from threading import Lock
 
+# Keys looked up by a single query, below the oldest SQLite limit of 999 bound parameters
+QUERY_CHUNK = 500
+
 
 class BlobDB:
     def __init__(self, logger: Logger, path: str = ":memory:"):
@@ -63,7 +66,8 @@ class BlobDB:
         except:
             self._logger.error("Failed to get user comment", exc_info=True)
         self._lock.release()
-        if not result:
+        # The row may have been created for the texture only
+        if not result or result[0] is None:
             return ""
         return result[0]
 
@@ -109,7 +113,7 @@ class BlobDB:
         except:
             self._logger.error("Failed to get user texture", exc_info=True)
         self._lock.release()
-        if not result:
+        if not result or result[0] is None:
             return b''
         return b64decode(result[0])
 
@@ -174,3 +178,85 @@ class BlobDB:
             result = False
         self._lock.release()
         return bool(result)
+
+    def update_user_blobs(self, comments: list[tuple[str, str, str]], textures: list[tuple[str, str, bytes]]):
+        """Store many (user hash, blob hash, blob) comments and textures in a single transaction"""
+        self._lock.acquire()
+        try:
+            self._cursor.executemany(
+                "INSERT INTO users(user_hash, comment_hash, comment) "
+                "VALUES(?,?,?) "
+                "ON CONFLICT(user_hash) "
+                "DO UPDATE SET comment_hash=excluded.comment_hash, comment=excluded.comment;",
+                comments
+            )
+            self._cursor.executemany(
+                "INSERT INTO users(user_hash, texture_hash, texture) "
+                "VALUES(?,?,?) "
+                "ON CONFLICT(user_hash) "
+                "DO UPDATE SET texture_hash=excluded.texture_hash, texture=excluded.texture;",
+                [(user_hash, texture_hash, b64encode(texture)) for user_hash, texture_hash, texture in textures]
+            )
+            self._db.commit()
+            self._logger.debug(f"updated {len(comments)} user comments and {len(textures)} user textures")
+        except sqlite3.Error:
+            self._db.rollback()
+            self._logger.error("Failed to update user blobs", exc_info=True)
+        finally:
+            self._lock.release()
+
+    def update_channel_descriptions(self, descriptions: list[tuple[int, str, str]]):
+        """Store many (channel id, description hash, description) in a single transaction"""
+        self._lock.acquire()
+        try:
+            self._cursor.executemany(
+                "INSERT INTO channels(channel_id, description_hash, description) "
+                "VALUES(?,?,?) "
+                "ON CONFLICT(channel_id) "
+                "DO UPDATE SET description_hash=excluded.description_hash, description=excluded.description;",
+                descriptions
+            )
+            self._db.commit()
+            self._logger.debug(f"updated {len(descriptions)} channel descriptions")
+        except sqlite3.Error:
+            self._db.rollback()
+            self._logger.error("Failed to update channel descriptions", exc_info=True)
+        finally:
+            self._lock.release()
+
+    def get_user_blob_hashes(self, user_hashes: list[str]) -> dict[str, tuple[str | None, str | None]]:
+        """Stored comment and texture hashes of many users"""
+        result = {}
+        self._lock.acquire()
+        try:
+            for i in range(0, len(user_hashes), QUERY_CHUNK):
+                chunk = user_hashes[i:i + QUERY_CHUNK]
+                rows = self._cursor.execute(
+                    "SELECT user_hash, comment_hash, texture_hash "
+                    f"FROM users WHERE user_hash IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                result.update((row[0], (row[1], row[2])) for row in rows)
+        except sqlite3.Error:
+            self._logger.error("Failed to get user blob hashes", exc_info=True)
+        finally:
+            self._lock.release()
+        return result
+
+    def get_channel_description_hashes(self, channel_ids: list[int]) -> dict[int, str | None]:
+        result = {}
+        self._lock.acquire()
+        try:
+            for i in range(0, len(channel_ids), QUERY_CHUNK):
+                chunk = channel_ids[i:i + QUERY_CHUNK]
+                rows = self._cursor.execute(
+                    "SELECT channel_id, description_hash "
+                    f"FROM channels WHERE channel_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                result.update(rows)
+        except sqlite3.Error:
+            self._logger.error("Failed to get channel description hashes", exc_info=True)
+        finally:
+            self._lock.release()
+        return result
@@ -6,15 +6,16 @@ if TYPE_CHECKING:
     from collections.abc import Callable
     from typing import NotRequired
 
-    from pymumble_typed.channels import Channel
+    from pymumble_typed.channels import Channel, Channels
     from pymumble_typed.messages import Message
     from pymumble_typed.mumble import Mumble
     from pymumble_typed.sound.audio import OpusPacket
-    from pymumble_typed.users import User
+    from pymumble_typed.users import User, Users
 
     CallbackLiteral = Literal[
         "on_connect",
         "on_disconnect",
+        "on_synced",
         "on_channel_created",
         "on_channel_updated",
         "on_channel_removed",
@@ -31,6 +32,7 @@ if TYPE_CHECKING:
 
     OnConnect = Callable[[None], None]
     OnDisconnect = Callable[[None], None]
+    OnSynced = Callable[[Users, Channels], None]
     OnChannelCreated = Callable[[Channel], None]
     OnChannelUpdated = Callable[[Channel, dict], None]
     OnChannelRemoved = Callable[[Channel], None]
@@ -51,6 +53,7 @@ from threading import current_thread
 class CallbackDict(TypedDict, total=False):
     on_connect: NotRequired[OnConnect]
     on_disconnect: NotRequired[OnDisconnect]
+    on_synced: NotRequired[OnSynced]
     on_channel_created: NotRequired[OnChannelCreated]
     on_channel_updated: NotRequired[OnChannelUpdated]
     on_channel_removed: NotRequired[OnChannelRemoved]
@@ -98,6 +101,10 @@ class Callbacks:
     def on_disconnect(self, func: OnDisconnect) -> None:
         self._temp["on_disconnect"] = func
 
+    def on_synced(self, func: OnSynced) -> None:
+        """Called once the initial users and channels have been received, instead of a created event for each"""
+        self._temp["on_synced"] = func
+
     def on_channel_created(self, func: OnChannelCreated) -> None:
         self._temp["on_channel_created"] = func
 
@@ -3,6 +3,8 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from concurrent.futures import Future
+
     from pymumble_typed.blobs import BlobDB
     from pymumble_typed.mumble import Mumble
     from pymumble_typed.protobuf.Mumble_pb2 import ChannelState
@@ -10,46 +12,65 @@ if TYPE_CHECKING:
 from threading import Lock
 
 from pymumble_typed.acl import ACL
+from pymumble_typed.blob_requests import BlobKind, resolved
 from pymumble_typed.commands import (
     CreateChannel,
     LinkChannel,
     Move,
     QueryACL,
     RemoveChannel,
-    RequestBlobCmd,
     TextMessage,
     UnlinkChannel,
     UpdateChannel,
 )
+from pymumble_typed.snapshot import ChannelSnapshot
 
 
 class Channel:
-    def __init__(self, mumble: Mumble, blob: BlobDB, packet: ChannelState):
+    # Slotted, with the description kept in the blob database and the ACL created on first use
+    __slots__ = ("_acl", "_blob", "_description_hash", "_mumble", "_parent", "can_enter", "id", "is_enter_restricted",
+                 "links", "max_users", "name", "position", "temporary")
+
+    def __init__(self, mumble: Mumble, blob: BlobDB, packet: ChannelState, store_blobs: bool = True):
         self._mumble = mumble
         self._blob = blob
         self.id: int = packet.channel_id
-        self.acl: ACL = ACL(mumble, packet.channel_id)
+        self._acl: ACL | None = None
         self.name: str = packet.name
         self._parent: int = packet.parent
 
-        self._description_hash = packet.description_hash
-        self.description = packet.description
-        if not (packet.HasField("description") or packet.HasField("description_hash")):
-            self._blob.update_channel_description(self.id, "", "")
-        elif self._blob.is_channel_description_updated(self.id, self._description_hash.hex()):
-            self.description = self._blob.get_channel_description(self.id)
-
         self._description_hash: bytes = packet.description_hash
-        self.description: str = self._blob.get_channel_description(self.id)
+        description = self._initial_description(packet)
+        if store_blobs and description:
+            self._blob.update_channel_description(*description)
         self.temporary: bool = packet.temporary
         self.position = packet.position
         self.max_users = packet.max_users
         self.can_enter = packet.can_enter
         self.is_enter_restricted = packet.is_enter_restricted
-        self.links: list[int] = packet.links
+        # Copied, the repeated field would keep the whole packet alive
+        self.links: list[int] = list(packet.links)
         if self._mumble.ready:
             self.request_description()
 
+    def _initial_description(self, packet: ChannelState) -> tuple[int, str, str] | None:
+        # Description sent along with a new channel, or an empty one when it has none
+        if packet.HasField("description"):
+            return self.id, self._description_hash.hex(), packet.description
+        if not packet.HasField("description_hash"):
+            return self.id, "", ""
+        return None
+
+    @property
+    def acl(self) -> ACL:
+        if self._acl is None:
+            self._acl = ACL(self._mumble, self.id)
+        return self._acl
+
+    @property
+    def description(self) -> str:
+        return self._blob.get_channel_description(self.id)
+
     @property
     def description_hash(self) -> bytes:
         return self._description_hash
@@ -85,27 +106,33 @@ class Channel:
         if packet.HasField("is_enter_restricted") and self.is_enter_restricted != packet.is_enter_restricted:
             actions["is_enter_restricted"] = self.is_enter_restricted
             self.is_enter_restricted = packet.is_enter_restricted
-        if packet.links and self.links != packet.links:
+        if packet.links and self.links != list(packet.links):
             actions["links"] = self.links
-            self.links = packet.links
+            self.links = list(packet.links)
         if packet.HasField("description_hash"):
             self._description_hash = packet.description_hash
             self.request_description()
         if packet.HasField("description"):
             actions["description"] = self.description
-            self.description = packet.description
-            if not self.description:
+            if not packet.description:
                 self._description_hash = b''
-                self._blob.update_channel_description(self.id, self._description_hash.hex(), self.description)
-            if self._description_hash:
-                self._blob.update_channel_description(self.id, self._description_hash.hex(), packet.description)
+            self._blob.update_channel_description(self.id, self._description_hash.hex(), packet.description)
         return actions
 
     def request_description(self):
-        if not self._description_hash:
-            return
-        cmd = RequestBlobCmd(channel_comment_hashes=[self.id])
-        self._mumble.execute_command(cmd, False)
+        if self._mumble.blob_greedy_update and self.needs_update():
+            self._mumble.blob_requests.request_description(self.id)
+
+    def fetch_description(self) -> Future[str]:
+        """
+        Description of the channel, requested to the server only if the stored one is missing or outdated.
+
+        The Future is resolved when the description is received, and at once when it is already stored. It can be
+        awaited with asyncio.wrap_future.
+        """
+        if not self.needs_update():
+            return resolved(self.description)
+        return self._mumble.blob_requests.fetch(BlobKind.DESCRIPTION, self.id)
 
     @property
     def parent(self) -> Channel | None:
@@ -114,8 +141,42 @@ class Channel:
         except KeyError:
             return None
 
+    @property
+    def parent_id(self) -> int | None:
+        # The root channel has no parent, the server leaves the field unset
+        return None if self._parent == self.id else self._parent
+
+    @property
+    def children(self) -> list[Channel]:
+        return self._mumble.channels.children_of(self.id)
+
+    @property
+    def path(self) -> list[Channel]:
+        """Channels from the root to this one, included"""
+        return self._mumble.channels.path_of(self.id)
+
+    @property
+    def depth(self) -> int:
+        return len(self._mumble.channels.path_ids(self.id)) - 1
+
+    def subtree(self) -> list[Channel]:
+        """This channel and all of its descendants, parents before children"""
+        return self._mumble.channels.subtree_of(self.id)
+
+    def snapshot(self) -> ChannelSnapshot:
+        return ChannelSnapshot(self.id, self.name, self.parent_id, self.position, self.max_users, self.temporary,
+                               tuple(self.links), self._description_hash)
+
     def get_users(self) -> list[User]:
-        return [user for user in self._mumble.users.values() if user.channel_id == self.id]
+        return self._mumble.users.in_channel(self.id)
+
+    def get_subtree_users(self) -> list[User]:
+        users = self._mumble.users
+        return [user for channel in self._mumble.channels.subtree_ids(self.id) for user in users.in_channel(channel)]
+
+    def subtree_user_count(self) -> int:
+        users = self._mumble.users
+        return sum(len(users.sessions_in_channel(channel)) for channel in self._mumble.channels.subtree_ids(self.id))
 
     def move_in(self, user: User | None = None):
         if user is None:
@@ -186,6 +247,13 @@ class Channels(dict[int, Channel]):
         self._mumble = mumble
         self._lock = Lock()
         self._blob = blob
+        # Channel tree, only changed under the lock: children of every channel and cached root to channel paths
+        self._children: dict[int, set[int]] = {}
+        self._paths: dict[int, tuple[int, ...]] = {}
+        # Bumped on every invalidation, so that a path computed meanwhile without the lock is not cached
+        self._paths_generation = 0
+        # Channels changed since the last snapshot, None while snapshots are not in use
+        self._changed: set[int] | None = None
         self._logger = mumble.logger.getChild(self.__class__.__name__)
 
     def current(self):
@@ -195,13 +263,24 @@ class Channels(dict[int, Channel]):
         with self._lock:
             try:
                 channel = self[packet.channel_id]
+                parent_id = channel.parent_id
                 before = channel.update(packet)
+                if self._changed is not None:
+                    self._changed.add(channel.id)
                 if not before:
                     return
+                self._mumble.permissions.invalidate()
+                if channel.parent_id != parent_id:
+                    self._unlink(channel.id, parent_id)
+                    self._link(channel)
                 self._mumble.callbacks.dispatch("on_channel_updated", channel, before)
             except KeyError:
                 channel = Channel(self._mumble, self._blob, packet)
                 self[packet.channel_id] = channel
+                self._link(channel)
+                self._mumble.permissions.invalidate()
+                if self._changed is not None:
+                    self._changed.add(channel.id)
                 self._mumble.callbacks.dispatch("on_channel_created", channel)
 
     def remove(self, channel_id: int):
@@ -209,10 +288,141 @@ class Channels(dict[int, Channel]):
             try:
                 channel = self[channel_id]
                 del self[channel_id]
+                self._unlink(channel_id, channel.parent_id)
+                self._mumble.permissions.invalidate()
+                if self._changed is not None:
+                    self._changed.add(channel_id)
                 self._mumble.callbacks.dispatch("on_channel_removed", channel)
             except KeyError:
                 self._logger.warning(f"cannot remove channel {channel_id}: channel do not exist")
 
+    def _link(self, channel: Channel):
+        if channel.parent_id is not None:
+            self._children.setdefault(channel.parent_id, set()).add(channel.id)
+        self._invalidate(channel.id)
+
+    def _unlink(self, channel_id: int, parent_id: int | None):
+        siblings = self._children.get(parent_id)
+        if siblings is not None:
+            siblings.discard(channel_id)
+            if not siblings:
+                del self._children[parent_id]
+        self._invalidate(channel_id)
+
+    def _invalidate(self, channel_id: int):
+        # Paths below the channel changed, they are computed again when needed
+        self._paths_generation += 1
+        for descendant in self.subtree_ids(channel_id):
+            self._paths.pop(descendant, None)
+
+    def clear(self):
+        with self._lock:
+            if self._changed is not None:
+                self._changed.update(self)
+            super().clear()
+            self._children = {}
+            self._paths = {}
+            self._paths_generation += 1
+
+    def load(self, packets: dict[int, list[ChannelState]]):
+        """
+        Apply at once the channels received before ServerSync, by id. Their descriptions are stored with one
+        transaction and no created event is dispatched, the client emits on_synced instead.
+        """
+        descriptions = []
+        with self._lock:
+            for channel_id, updates in packets.items():
+                channel = self.get(channel_id)
+                existing = channel is not None
+                if not existing:
+                    channel = Channel(self._mumble, self._blob, updates[0], store_blobs=False)
+                    description = channel._initial_description(updates[0])
+                    descriptions += [description] if description else []
+                    self[channel_id] = channel
+                    updates = updates[1:]
+                parent_id = channel.parent_id
+                for packet in updates:
+                    channel.update(packet)
+                if existing and channel.parent_id != parent_id:
+                    self._unlink(channel_id, parent_id)
+                self._link(channel)
+                if self._changed is not None:
+                    self._changed.add(channel_id)
+        self._mumble.permissions.invalidate()
+        self._blob.update_channel_descriptions(descriptions)
+
+    def outdated_descriptions(self) -> list[int]:
+        """Ids of the channels whose stored description is missing or stale, with one query"""
+        channels = [channel for channel in self.values() if channel.description_hash]
+        stored = self._blob.get_channel_description_hashes([channel.id for channel in channels])
+        return [channel.id for channel in channels if stored.get(channel.id) != channel.description_hash.hex()]
+
+    def track_changes(self):
+        """Start recording the changed channels for take_changes, every current channel counts as changed"""
+        with self._lock:
+            self._changed = set(self)
+
+    def take_changes(self) -> dict[int, ChannelSnapshot | None] | None:
+        """Snapshots of the channels changed since the previous call, None for the removed ones"""
+        with self._lock:
+            if not self._changed:
+                return None
+            changed, self._changed = self._changed, set()
+            return {channel_id: self[channel_id].snapshot() if channel_id in self else None for channel_id in changed}
+
+    def children_of(self, channel_id: int) -> list[Channel]:
+        """Direct sub-channels, in the order shown by the clients"""
+        children = [self[child] for child in list(self._children.get(channel_id, ())) if child in self]
+        return sorted(children, key=lambda channel: (channel.position, channel.name))
+
+    def path_ids(self, channel_id: int) -> tuple[int, ...]:
+        path = self._paths.get(channel_id)
+        if path is not None:
+            return path
+        generation = self._paths_generation
+        ids = [channel_id]
+        channel = self.get(channel_id)
+        while channel is not None and channel.parent_id is not None and channel.parent_id not in ids:
+            cached = self._paths.get(channel.parent_id)
+            if cached is not None:
+                path = cached + tuple(reversed(ids))
+                break
+            ids.append(channel.parent_id)
+            channel = self.get(channel.parent_id)
+        else:
+            path = tuple(reversed(ids))
+        # Called by reader threads too: the path is only cached if the tree did not change while it was computed
+        with self._lock:
+            if generation == self._paths_generation:
+                self._paths[channel_id] = path
+        return path
+
+    def path_of(self, channel_id: int) -> list[Channel]:
+        return [self[i] for i in self.path_ids(channel_id) if i in self]
+
+    def subtree_ids(self, channel_id: int) -> list[int]:
+        """The channel and all of its descendants, parents before children"""
+        ids = [channel_id]
+        seen = {channel_id}
+        for current in ids:
+            for child in list(self._children.get(current, ())):
+                if child not in seen:
+                    seen.add(child)
+                    ids.append(child)
+        return ids
+
+    def subtree_of(self, channel_id: int) -> list[Channel]:
+        return [self[i] for i in self.subtree_ids(channel_id) if i in self]
+
+    def find_path(self, path: str, root: int = 0) -> Channel | None:
+        """Channel at a path of names separated by slashes, like "/Events/Stage", relative to `root`"""
+        channel = self.get(root)
+        for name in filter(None, path.split("/")):
+            if channel is None:
+                return None
+            channel = next((child for child in self.children_of(channel.id) if child.name == name), None)
+        return channel
+
     def new_channel(self, parent_id: int, name: str, temporary: bool = False):
         command = CreateChannel(parent_id, name, temporary)
         self._mumble.execute_command(command)
@@ -9,7 +9,15 @@ if TYPE_CHECKING:
 
 from pymumble_typed import MessageType
 from pymumble_typed.messages import ImageTooBigError, TextTooLongError
-from pymumble_typed.protobuf.Mumble_pb2 import ACL, ChannelRemove, ChannelState, RequestBlob, UserRemove, UserState
+from pymumble_typed.protobuf.Mumble_pb2 import (
+    ACL,
+    ChannelRemove,
+    ChannelState,
+    PermissionQuery,
+    RequestBlob,
+    UserRemove,
+    UserState,
+)
 from pymumble_typed.protobuf.Mumble_pb2 import TextMessage as TextMessagePacket
 from pymumble_typed.protobuf.Mumble_pb2 import VoiceTarget as VoiceTargetPacket
 
@@ -147,14 +155,55 @@ class UpdateChannel(Command):
             self.packet.description = description
 
 
+# Slots available to a client for its voice targets, 0 is normal talking and 31 the server loopback
+VOICE_TARGET_SLOTS = range(1, 31)
+
+
+class VoiceTargetEntry:
+    """
+    Receivers of a voice target slot: the users in `sessions`, or the channel `channel_id`, optionally with its linked
+    channels and its sub-channels, and restricted to the members of `group`.
+    """
+
+    def __init__(self, sessions: list[int] | None = None, channel_id: int | None = None, group: str | None = None,
+                 links: bool = False, children: bool = False):
+        if bool(sessions) == (channel_id is not None):
+            raise ValueError("A voice target entry needs either sessions or a channel")
+        self.sessions = sessions or []
+        self.channel_id = channel_id
+        self.group = group
+        self.links = links
+        self.children = children
+
+    def to_packet(self) -> VoiceTargetPacket.Target:
+        target = VoiceTargetPacket.Target()
+        if self.channel_id is None:
+            target.session.extend(self.sessions)
+            return target
+        target.channel_id = self.channel_id
+        if self.group:
+            target.group = self.group
+        target.links = self.links
+        target.children = self.children
+        return target
+
+    def __repr__(self):
+        if self.channel_id is None:
+            return f"VoiceTargetEntry(sessions={self.sessions})"
+        return (f"VoiceTargetEntry(channel_id={self.channel_id}, group={self.group}, links={self.links}, "
+                f"children={self.children})")
+
+
 class VoiceTarget(Command):
-    def __init__(self, voice_id: int, targets: list[int]):
+    def __init__(self, voice_id: int, targets: list[int] | list[VoiceTargetEntry]):
         super().__init__()
         self.type = MessageType.VoiceTarget
         self.packet = VoiceTargetPacket()
         self.packet.id = voice_id
         _targets: list[VoiceTargetPacket.Target] = []
-        if voice_id == 1:
+        if targets and isinstance(targets[0], VoiceTargetEntry):
+            _targets = [entry.to_packet() for entry in targets]
+        elif voice_id == 1 and targets:
             target = VoiceTargetPacket.Target()
             target.channel_id = targets[0]
             _targets.append(target)
@@ -163,7 +212,7 @@ class VoiceTarget(Command):
                 target_ = VoiceTargetPacket.Target()
                 target_.session.append(target)
                 _targets.append(target_)
-        self.packet.targets.extend(targets)
+        self.packet.targets.extend(_targets)
 
 
 class LinkChannel(Command):
@@ -194,6 +243,14 @@ class QueryACL(Command):
         self.packet.query = True
 
 
+class QueryPermissions(Command):
+    def __init__(self, channel_id: int):
+        super().__init__()
+        self.type = MessageType.PermissionQuery
+        self.packet = PermissionQuery()
+        self.packet.channel_id = channel_id
+
+
 class ChannelGroup:
     def __init__(self, name: str, inherited: bool | None = None, inherit: bool | None = None,
                  inheritable: bool | None = None, add: list[int] | None = None, remove: list[int] | None = None):
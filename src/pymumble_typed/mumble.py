@@ -3,8 +3,11 @@ from __future__ import annotations
 from typing import TYPE_CHECKING, TypedDict
 
 if TYPE_CHECKING:
+    from collections.abc import Callable, Iterable
     from logging import Logger
 
+    from pymumble_typed.users import User
+
 import struct
 import sys
 from contextlib import suppress
@@ -12,22 +15,35 @@ from enum import IntEnum
 from logging import DEBUG, ERROR, Formatter, StreamHandler, getLogger
 from signal import SIGINT, signal
 from threading import current_thread
+from time import perf_counter
 
 from pymumble_typed import MessageType, UdpMessageType
+from pymumble_typed.blob_requests import BlobKind, BlobRequestScheduler
 from pymumble_typed.blobs import BlobDB
 from pymumble_typed.callbacks import Callbacks
 from pymumble_typed.channels import Channels
-from pymumble_typed.commands import Command, RequestBlobCmd, VoiceTarget
+from pymumble_typed.commands import (
+    VOICE_TARGET_SLOTS,
+    Command,
+    QueryPermissions,
+    VoiceTarget,
+    VoiceTargetEntry,
+)
 from pymumble_typed.messages import Message as MessageContainer
 from pymumble_typed.network import ConnectionRejectedError
 from pymumble_typed.network.control import ControlStack, Status
 from pymumble_typed.network.ping import Ping
 from pymumble_typed.network.voice import VoiceStack
+from pymumble_typed.permissions import Permission, PermissionEngine
+from pymumble_typed.prefetch import BLOB_FIELDS, PrefetchPolicy
 from pymumble_typed.protobuf import Mumble_pb2
 from pymumble_typed.protobuf.MumbleUDP_pb2 import Audio
 from pymumble_typed.protobuf.MumbleUDP_pb2 import Ping as UdpPingPacket
+from pymumble_typed.snapshot import Snapshot, SnapshotPublisher
 from pymumble_typed.sound import BANDWIDTH, AudioType, CodecNotSupportedError, CodecProfile
+from pymumble_typed.sound.adaptive import AdaptiveBitrate
 from pymumble_typed.sound.audio import OpusPacket
+from pymumble_typed.sound.sender import PacedSender
 from pymumble_typed.sound.voice import VoiceOutput
 from pymumble_typed.tools import VarInt
 from pymumble_typed.users import Users
@@ -62,6 +78,7 @@ class Mumble:
         max_processes: int = 1,
         debug: bool = False,
         logger: Logger | None = None,
+        snapshots: bool = False,
     ):
         super().__init__()
         self._command_limit = 5
@@ -84,12 +101,24 @@ class Mumble:
         self._stereo = stereo
 
         self.sound_receive = False
+        self._sound_sinks: list[Callable[[User, OpusPacket], None]] = []
+        self._user_removed_sinks: list[Callable[[User], None]] = []
         self._callbacks = Callbacks(self)
 
         self._bandwidth = BANDWIDTH
         self._server_max_bandwidth = 0
+        self.permissions = PermissionEngine(self)
+        # Reject locally the commands that the server would certainly deny, raising PermissionDeniedError
+        self.check_permissions = False
         self.users: Users = Users(self, self._blob)
         self.channels: Channels = Channels(self, self._blob)
+        self._snapshots = SnapshotPublisher() if snapshots else None
+        # Channels and users received before ServerSync, by id, applied at once when the synchronization ends
+        self._sync_channels: dict[int, list[Mumble_pb2.ChannelState]] | None = None
+        self._sync_users: dict[int, list[Mumble_pb2.UserState]] | None = None
+        if self._snapshots:
+            self.users.track_changes()
+            self.channels.track_changes()
         self.settings = Settings(
             server_allow_html=True, server_max_message_length=5000, server_max_image_message_length=131072
         )
@@ -98,9 +127,16 @@ class Mumble:
             host, port, user, password, tokens, cert_file, key_file, self._ping, client_type, self._logger
         )
         self._voice: VoiceStack = VoiceStack(self._control, self._logger)
+        self.blob_requests = BlobRequestScheduler(self._control, self._logger)
+        self.prefetch = PrefetchPolicy(self)
+        self.blob_requests.set_policy(self.prefetch)
         self._ping.set_voice(self._voice)
         self._ping.set_control(self._control)
-        self.voice = VoiceOutput(self._control, self._voice)
+        self._sender = PacedSender(self._logger)
+        self.voice = VoiceOutput(self._control, self._voice, self._sender)
+        self._voice_targets: dict[int, list[VoiceTargetEntry]] = {}
+        self._streams: dict[int, VoiceOutput] = {}
+        self._adaptive_bitrate: AdaptiveBitrate | None = None
         self._reconnect = reconnect
 
         with suppress(ValueError):  # Workaround for Python 3.14, signal worked on Python <=3.13
@@ -155,17 +191,40 @@ class Mumble:
         )
         self.users = Users(self, self._blob)
         self.channels = Channels(self, self._blob)
+        self.permissions.reset()
+        if self._snapshots:
+            self._snapshots.reset()
+            self.users.track_changes()
+            self.channels.track_changes()
         if self._control:
             self._control.disconnect()
         self._control = self._control.reinit()
         self._control.set_control_message_dispatcher(self._dispatch_control_message)
+        if self._snapshots:
+            self._control.set_batch_action(lambda: self._snapshots.publish(self.users, self.channels))
         self._control.reconnect = self._reconnect
         self._voice: VoiceStack = VoiceStack(self._control, self._logger)
-        self.voice = VoiceOutput(self._control, self._voice)
+        self.blob_requests.stop()
+        self.blob_requests = BlobRequestScheduler(self._control, self._logger)
+        self.blob_requests.set_policy(self.prefetch)
+        self.voice.close()
+        self.voice = VoiceOutput(self._control, self._voice, self._sender)
+        # Streams belong to the previous connection, the targets are registered again on the next ServerSync
+        for stream in self._streams.values():
+            stream.close()
+            if self._adaptive_bitrate:
+                self._adaptive_bitrate.remove_encoder(stream.encoder)
+        self._streams = {}
+        self._rebalance_bandwidth()
         self._control.set_disconnect_action(lambda: self.callbacks.dispatch("on_disconnect"))
         self._ping.set_control(self._control)
         self._ping.set_voice(self._voice)
         self._ping.reset()
+        if self._adaptive_bitrate:
+            self._adaptive_bitrate.set_voice(self._voice)
+            self._adaptive_bitrate.set_encoder(self.voice.encoder)
+            self._adaptive_bitrate.reset()
+            self._adaptive_bitrate.start()
 
     def _dispatch_voice_message(self, packet: bytes):
         _type = packet[0]
@@ -178,7 +237,7 @@ class Mumble:
             if _type == UdpMessageType.Audio and self.sound_receive:
                 packet = Audio()
                 packet.ParseFromString(message)
-                self._sound_received(packet)
+                self._sound_received(packet, self._voice.last_received)
             elif _type == UdpMessageType.Ping:
                 packet = UdpPingPacket()
                 packet.ParseFromString(message)
@@ -187,7 +246,7 @@ class Mumble:
                     self._logger.debug(f"updated server max bandwidth per client {self._server_max_bandwidth}")
                 self._voice.ping_response(packet)
 
-    def _dispatch_legacy_voice_message(self, packet: bytes):
+    def _dispatch_legacy_voice_message(self, packet: bytes, received: float | None = None):
         pos = 0
         (header,) = struct.unpack("!B", bytes([packet[pos]]))
         _type = (header & 0b11100000) >> 5
@@ -195,7 +254,8 @@ class Mumble:
         if _type == AudioType.PING:
             self._voice.ping_legacy_response(packet[1:])
         else:
-            self._legacy_sound_received(_type, target, packet[1:])
+            received = self._voice.last_received if received is None else received
+            self._legacy_sound_received(_type, target, memoryview(packet)[1:], received)
 
     def _dispatch_control_message(self, _type: int, message: bytes):
         try:
@@ -204,13 +264,13 @@ class Mumble:
             self._logger.debug(f"received TCP packet type: {_type}")
         if _type == MessageType.UDPTunnel and self.sound_receive:
             if self._control.server_version < (1, 5, 0):
-                self._dispatch_legacy_voice_message(message)
+                self._dispatch_legacy_voice_message(message, self._control.last_received)
             else:
                 packet = Mumble_pb2.UDPTunnel()
                 packet.ParseFromString(message)
                 udp_packet = Audio()
                 udp_packet.ParseFromString(packet.packet)
-                self._sound_received(udp_packet)
+                self._sound_received(udp_packet, self._control.last_received)
             return
 
         msg_type = MessageType(_type)
@@ -224,8 +284,16 @@ class Mumble:
                 #    We are clearing the channels map as well for good measure.
                 #    At this time there's no usable callback to the Mumble class to clear the user map, so we clear that
                 #    once the Version packet is received, as the connection is starting at this point.
+                # Sessions do not survive a reconnection, the users of the previous connection are gone
+                for user in list(self.users.values()):
+                    self._emit_user_removed(user)
                 self.users.clear()
                 self.channels.clear()
+                self.permissions.reset()
+                self.blob_requests.reset()
+                self.prefetch.reset()
+                self._sync_channels = {}
+                self._sync_users = {}
                 self._control.set_version(packet)
                 self._logger.debug(f"received version: {packet.version_v1}")
                 if self._control.server_version < (1, 5, 0):
@@ -236,55 +304,81 @@ class Mumble:
                 self._logger.debug(f"received authenticate. Session: {packet.session}")
             case MessageType.Ping:
                 self._control.ping.tcp.update()
+                self._control.ping.update_remote(packet.good, packet.late, packet.lost)
             case MessageType.Reject:
                 self._control.status = Status.FAILED
                 self._control.ready()
                 raise ConnectionRejectedError(packet.reason)
             case MessageType.ServerSync:
+                synced = self._sync_channels is not None
+                if synced:
+                    self._apply_sync()
                 if self.blob_greedy_update:
-                    user_comment_sessions = [
-                        user.session for user in self.users.values() if not user.is_comment_updated()
-                    ]
-                    user_texture_sessions = [
-                        user.session for user in self.users.values() if not user.is_avatar_updated()
-                    ]
-                    channel_ids = [channel.id for channel in self.channels.values() if channel.needs_update()]
-                    if user_comment_sessions or user_texture_sessions or channel_ids:
-                        self._logger.debug(
-                            f"requesting blob updates for UsersComment({user_comment_sessions}), "
-                            f"UsersTexture({user_texture_sessions}), Channels({channel_ids})"
-                        )
-                        cmd = RequestBlobCmd(
-                            user_texture_hashes=user_texture_sessions,
-                            user_comment_hashes=user_comment_sessions,
-                            channel_comment_hashes=channel_ids,
-                        )
-                        self.execute_command(cmd, False)
+                    user_comment_sessions, user_texture_sessions = self.users.outdated_blobs()
+                    channel_ids = self.channels.outdated_descriptions()
+                    self.blob_requests.request(BlobKind.COMMENT, user_comment_sessions)
+                    self.blob_requests.request(BlobKind.TEXTURE, user_texture_sessions)
+                    self.blob_requests.request(BlobKind.DESCRIPTION, channel_ids)
                 self._voice.sync()
                 self.users.set_myself(packet.session)
                 self.set_bandwidth(packet.max_bandwidth)
+                for slot, entries in self._voice_targets.items():
+                    self.execute_command(VoiceTarget(slot, entries), False)
                 if self._control.status == Status.AUTHENTICATING:
                     self._control.status = Status.CONNECTED
                     self._ready = True
                     self._control.ready()
                     self._callbacks.ready()
                     self._callbacks.dispatch("on_connect")
+                if synced:
+                    self._callbacks.dispatch("on_synced", self.users, self.channels)
             case MessageType.ChannelRemove:
-                self.channels.remove(packet.channel_id)
+                self.blob_requests.forget_channel(packet.channel_id)
+                if self._sync_channels is not None:
+                    self._sync_channels.pop(packet.channel_id, None)
+                else:
+                    self.channels.remove(packet.channel_id)
             case MessageType.ChannelState:
-                self.channels.handle_update(packet)
+                if self._sync_channels is not None:
+                    self._sync_channels.setdefault(packet.channel_id, []).append(packet)
+                else:
+                    self.channels.handle_update(packet)
+                if packet.HasField("description"):
+                    self.blob_requests.received(BlobKind.DESCRIPTION, packet.channel_id, packet.description)
             case MessageType.UserRemove:
-                self.users.remove(packet)
+                self.blob_requests.forget_user(packet.session)
+                self.prefetch.forget(packet.session)
+                if self._sync_users is not None:
+                    self._sync_users.pop(packet.session, None)
+                else:
+                    user = self.users.get(packet.session)
+                    self.users.remove(packet)
+                    if user is not None:
+                        self._emit_user_removed(user)
             case MessageType.UserState:
-                self.users.handle_update(packet)
+                if self._sync_users is not None:
+                    self._sync_users.setdefault(packet.session, []).append(packet)
+                else:
+                    self.users.handle_update(packet)
+                    # Blob replies, even when prefetched, are not activity
+                    if any(field.name not in BLOB_FIELDS for field, _ in packet.ListFields()):
+                        self.prefetch.note_activity(packet.session)
+                # Resolved once stored, so that the content can already be read from the user
+                if packet.HasField("comment"):
+                    self.blob_requests.received(BlobKind.COMMENT, packet.session, packet.comment)
+                if packet.HasField("texture"):
+                    self.blob_requests.received(BlobKind.TEXTURE, packet.session, packet.texture)
             case MessageType.BanList:
                 pass
             case MessageType.TextMessage:
+                self.prefetch.note_activity(packet.actor)
                 self._callbacks.dispatch("on_message", MessageContainer(self, packet))
             case MessageType.PermissionDenied:
                 self._callbacks.dispatch(
                     "on_permission_denied", packet.session, packet.channel_id, packet.name, packet.type, packet.reason
                 )
+            case MessageType.PermissionQuery:
+                self.permissions.handle_query(packet)
             case MessageType.ACL:
                 self.channels[packet.channel_id].update_acl(packet)
                 # FIXME(nico9889): CALLBACK ACL
@@ -300,7 +394,6 @@ class Mumble:
                 MessageType.ContextAction
                 | MessageType.UserList
                 | MessageType.VoiceTarget
-                | MessageType.PermissionQuery
                 | MessageType.CodecVersion
                 | MessageType.UserStats
             ):
@@ -308,6 +401,7 @@ class Mumble:
             case MessageType.ServerConfig:
                 if packet.HasField("max_bandwidth"):
                     self._server_max_bandwidth = packet.max_bandwidth
+                    self.set_bandwidth(self._bandwidth)
                 if packet.HasField("allow_html"):
                     self.settings["server_allow_html"] = packet.allow_html
                 if packet.HasField("message_length"):
@@ -315,12 +409,36 @@ class Mumble:
                 if packet.HasField("image_message_length"):
                     self.settings["server_max_image_message_length"] = packet.image_message_length
 
+    def _apply_sync(self):
+        start = perf_counter()
+        channels, users = self._sync_channels, self._sync_users
+        self._sync_channels = self._sync_users = None
+        self.channels.load(channels)
+        self.users.load(users)
+        self._logger.debug(f"synchronized {len(channels)} channels and {len(users)} users "
+                           f"in {perf_counter() - start:.3f}s")
+
+    @property
+    def snapshot(self) -> Snapshot | None:
+        """
+        Immutable view of users and channels as of the last batch of control messages, None unless the client was
+        created with snapshots=True. Reading it never blocks nor races with the network thread.
+        """
+        return self._snapshots.snapshot if self._snapshots else None
+
     def set_bandwidth(self, bandwidth: int):
         if self._server_max_bandwidth is not None:
             self._bandwidth = min(bandwidth, self._server_max_bandwidth)
-        self.voice.encoder.bandwidth = self._bandwidth
+        self._rebalance_bandwidth()
 
-    def _legacy_sound_received(self, _type: AudioType, target: int, packet: bytes):
+    def _rebalance_bandwidth(self):
+        # The bandwidth limit of the server applies to the user, so it is shared by the main output and every stream
+        outputs = [self.voice, *self._streams.values()]
+        share = self._bandwidth // len(outputs)
+        for output in outputs:
+            output.encoder.bandwidth = share
+
+    def _legacy_sound_received(self, _type: AudioType, target: int, packet: memoryview, received: float):
         pos = 0
         session = VarInt()
         pos += session.decode(packet[pos : pos + 10])
@@ -329,6 +447,7 @@ class Mumble:
         pos += sequence.decode(packet[pos : pos + 10])
 
         terminator = False
+        is_terminator = False
 
         while (pos < len(packet)) and not terminator:
             if _type == AudioType.OPUS:
@@ -338,6 +457,8 @@ class Mumble:
 
                 if not (size & 0x2000):
                     terminator = True
+                else:
+                    is_terminator = True
                 size &= 0x1FFF
             else:
                 (header,) = struct.unpack("!B", packet[pos : pos + 1])
@@ -351,8 +472,9 @@ class Mumble:
                     user = self.users[session.value]
                     if _type != AudioType.OPUS:
                         raise CodecNotSupportedError(f"Codec not supported: {_type.name}")
-                    packet = OpusPacket(packet[pos : pos + size], sequence.value, target)
-                    self._callbacks.dispatch("on_sound_received", user, packet)
+                    wrapper = OpusPacket(packet[pos : pos + size], sequence.value, target, received,
+                                         is_terminator=is_terminator, session=session.value)
+                    self._emit_sound(user, wrapper)
                     sequence.value += 1
                 except CodecNotSupportedError:
                     self._logger.error("codec not supported", exc_info=True)
@@ -360,16 +482,49 @@ class Mumble:
                     self._logger.error(f"invalid user session {session.value}")
             pos += size
 
-    def _sound_received(self, packet: Audio):
+    def _sound_received(self, packet: Audio, received: float):
         try:
             user = self.users[packet.sender_session]
-            wrapper = OpusPacket(packet.opus_data, packet.frame_number, packet.target)
-            self._callbacks.dispatch("on_sound_received", user, wrapper)
+            # A volume adjustment of 0 means that the server didn't set it
+            wrapper = OpusPacket(packet.opus_data, packet.frame_number, packet.target, received,
+                                 volume_adjustment=packet.volume_adjustment or 1., is_terminator=packet.is_terminator,
+                                 session=packet.sender_session)
+            self._emit_sound(user, wrapper)
         except CodecNotSupportedError:
             self._logger.error("codec not supported", exc_info=True)
         except KeyError:
             self._logger.error(f"Invalid user session {packet.sender_session}")
 
+    def _emit_sound(self, user: User, packet: OpusPacket):
+        self.prefetch.note_voice(user.session)
+        # Sinks run synchronously on the receiving thread, they are expected to only buffer the packet
+        for sink in self._sound_sinks:
+            try:
+                sink(user, packet)
+            except Exception:
+                self._logger.error("Error while executing sound sink", exc_info=True)
+        self._callbacks.dispatch("on_sound_received", user, packet)
+
+    def add_sound_sink(self, sink: Callable[[User, OpusPacket], None]):
+        self._sound_sinks = [*self._sound_sinks, sink]
+
+    def remove_sound_sink(self, sink: Callable[[User, OpusPacket], None]):
+        self._sound_sinks = [s for s in self._sound_sinks if s != sink]
+
+    def _emit_user_removed(self, user: User):
+        for sink in self._user_removed_sinks:
+            try:
+                sink(user)
+            except Exception:
+                self._logger.error("Error while executing user removed sink", exc_info=True)
+
+    def add_user_removed_sink(self, sink: Callable[[User], None]):
+        """Run `sink` on the control thread whenever a user leaves, unlike the on_user_removed callback it can be many"""
+        self._user_removed_sinks = [*self._user_removed_sinks, sink]
+
+    def remove_user_removed_sink(self, sink: Callable[[User], None]):
+        self._user_removed_sinks = [s for s in self._user_removed_sinks if s != sink]
+
     def set_application_string(self, string: str):
         self._control.set_application_string(string)
 
@@ -389,6 +544,8 @@ class Mumble:
         self._control.is_ready()
 
     def execute_command(self, cmd: Command, blocking: bool = True):
+        if self.check_permissions:
+            self.permissions.check(cmd)
         if blocking:
             self.is_ready()
         self._control.send_command(cmd)
@@ -403,19 +560,130 @@ class Mumble:
         self.logger.debug("Received Termination Signal. Stopping Mumble client...")
         self._control.disconnect(True)
         self._voice.stop()
+        for stream in self._streams.values():
+            stream.close()
+        self._streams = {}
+        self._sender.stop()
+        self.blob_requests.stop()
+        if self._adaptive_bitrate:
+            self._adaptive_bitrate.cancel()
+
+    def enable_adaptive_bitrate(self, **kwargs):
+        """Adapt bitrate and FEC of the encoder to the measured loss and jitter, see AdaptiveBitrate for the options"""
+        self.disable_adaptive_bitrate()
+        self._adaptive_bitrate = AdaptiveBitrate(self._ping, self._logger, **kwargs)
+        self._adaptive_bitrate.set_voice(self._voice)
+        self._adaptive_bitrate.set_encoder(self.voice.encoder)
+        for stream in self._streams.values():
+            self._adaptive_bitrate.add_encoder(stream.encoder)
+        self._adaptive_bitrate.start()
+
+    def disable_adaptive_bitrate(self):
+        if self._adaptive_bitrate:
+            self._adaptive_bitrate.cancel()
+            self._adaptive_bitrate = None
+            for output in [self.voice, *self._streams.values()]:
+                output.encoder.target_bitrate = None
+
+    @property
+    def adaptive_bitrate(self) -> AdaptiveBitrate | None:
+        return self._adaptive_bitrate
 
     def request_blob(self, packet):
         self._control.send_message(MessageType.RequestBlob, packet)
 
     def reauthenticate(self, token):
         self._control.reauthenticate(token)
+        self.permissions.invalidate()
+
+    def query_permissions(self, channel_ids: Iterable[int]):
+        """Ask the server for our permissions in the channels not known yet, their answers feed has_permission"""
+        for channel_id in self.permissions.to_query(channel_ids):
+            self.execute_command(QueryPermissions(channel_id), False)
+
+    def has_permission(self, channel_id: int, permission: Permission) -> bool | None:
+        """
+        Whether we have every permission in `permission` in the channel, None when it cannot be known.
+
+        The permissions reported by the server are used when available, the ones computed from the known ACLs
+        otherwise. It is answered locally, so it can be called before every move, message or whisper.
+        """
+        myself = self.users.myself
+        if myself is None:
+            return None
+        return self.permissions.has_permission(myself.session, channel_id, permission)
+
+    @property
+    def tunnelled_voice_at(self) -> float:
+        """Monotonic time at which voice last went through the control connection"""
+        return self._control.last_tunnelled_voice
+
+    @property
+    def tokens(self) -> list[str]:
+        return list(self._control.tokens)
 
     def set_whisper(self, target_ids: list[int], channel=False):
+        # Whispers use the voice target slots 1 and 2, registered like any other so they are kept in sync
+        if channel:
+            self.register_voice_target(1, [VoiceTargetEntry(channel_id=target_ids[0])])
+        else:
+            self.register_voice_target(2, [VoiceTargetEntry(sessions=[session]) for session in target_ids])
         self.voice.target = 1 if channel else 2
-        command = VoiceTarget(self.voice.target, target_ids)
-        self.execute_command(command)
 
     def remove_whisper(self):
+        slot = self.voice.target
         self.voice.target = 0
-        command = VoiceTarget(self.voice.target, [])
-        self.execute_command(command)
+        if slot in (1, 2):
+            self.unregister_voice_target(slot)
+
+    def register_voice_target(self, slot: int, entries: list[VoiceTargetEntry]):
+        """Set the receivers of the voice target `slot`, kept across reconnections"""
+        if slot not in VOICE_TARGET_SLOTS:
+            raise ValueError(f"Invalid voice target slot: {slot}. It must be in [{VOICE_TARGET_SLOTS.start}, "
+                             f"{VOICE_TARGET_SLOTS.stop - 1}].")
+        if not entries:
+            raise ValueError("A voice target needs at least one entry")
+        self._voice_targets[slot] = list(entries)
+        if self._ready:
+            self.execute_command(VoiceTarget(slot, entries))
+
+    def unregister_voice_target(self, slot: int):
+        """Clear the voice target `slot`, closing its stream"""
+        self.close_voice_stream(slot)
+        if self._voice_targets.pop(slot, None) is not None and self._ready:
+            self.execute_command(VoiceTarget(slot, []))
+
+    @property
+    def voice_targets(self) -> dict[int, list[VoiceTargetEntry]]:
+        return dict(self._voice_targets)
+
+    def open_voice_stream(self, slot: int) -> VoiceOutput:
+        """
+        Return the outbound stream talking to the voice target `slot`, creating it if needed.
+
+        Every stream has its own encoder, buffer and sequence, and all of them are sent concurrently by the same paced
+        sender, so different audio can be played to different targets at the same time.
+        """
+        if slot not in self._voice_targets:
+            raise ValueError(f"Voice target slot {slot} is not registered")
+        stream = self._streams.get(slot)
+        if stream is None:
+            stream = VoiceOutput(self._control, self._voice, self._sender, target=slot)
+            self._streams = {**self._streams, slot: stream}
+            self._rebalance_bandwidth()
+            if self._adaptive_bitrate:
+                self._adaptive_bitrate.add_encoder(stream.encoder)
+        return stream
+
+    def close_voice_stream(self, slot: int):
+        stream = self._streams.get(slot)
+        if stream is not None:
+            self._streams = {s: o for s, o in self._streams.items() if s != slot}
+            stream.close()
+            if self._adaptive_bitrate:
+                self._adaptive_bitrate.remove_encoder(stream.encoder)
+            self._rebalance_bandwidth()
+
+    @property
+    def voice_streams(self) -> dict[int, VoiceOutput]:
+        return dict(self._streams)
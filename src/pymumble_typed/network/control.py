@@ -19,7 +19,7 @@ from socket import AF_UNSPEC, SOCK_STREAM, getaddrinfo, socket
 from ssl import PROTOCOL_TLSv1, PROTOCOL_TLSv1_2, SSLContext, SSLEOFError, SSLError
 from struct import pack, unpack
 from threading import Lock, Thread, current_thread
-from time import sleep
+from time import monotonic, sleep
 
 from pymumble_typed import MessageType
 from pymumble_typed.commands import Command
@@ -61,7 +61,12 @@ class ControlStack:
         self.msg_queue: Queue[Command | AudioData] = Queue(maxsize=20)
         self.audio_queue: Queue[AudioData] = Queue(maxsize=20)
         self.receive_buffer: bytes = b''
+        # Monotonic time at which the last chunk was read from the socket
+        self.last_received = monotonic()
+        # Last time voice went through the control connection, in either direction, because UDP is not available
+        self.last_tunnelled_voice = 0.
         self._dispatch_control_message = lambda _, __: None
+        self._on_batch: Callable[[], None] = lambda: None
         self.thread = Thread(target=self.loop, name="ControlStack:Loop")
 
         self._ready = Lock()
@@ -83,6 +88,10 @@ class ControlStack:
     def set_control_message_dispatcher(self, dispatcher: Callable[[int, bytes], None]):
         self._dispatch_control_message = dispatcher
 
+    def set_batch_action(self, func: Callable[[], None]):
+        """Call `func` once all the control messages received together have been dispatched"""
+        self._on_batch = func
+
     def _craft_version_packet(self) -> Version:
         version = Version()
         if PROTOCOL_VERSION[2] > 255:
@@ -199,6 +208,7 @@ class ControlStack:
     def _read_control_messages(self):
         try:
             buffer: bytes = self.socket.recv(READ_BUFFER_SIZE)
+            self.last_received = monotonic()
             self.receive_buffer += buffer
         except (ConnectionResetError, TimeoutError, SSLEOFError):
             self.logger.warning("Server terminated the connection", exc_info=True)
@@ -208,6 +218,7 @@ class ControlStack:
             self.logger.error("error while reading control messages", exc_info=True)
             return
 
+        dispatched = False
         while len(self.receive_buffer) >= 6:
             header = self.receive_buffer[0:6]
 
@@ -221,7 +232,12 @@ class ControlStack:
 
             message: bytes = self.receive_buffer[6:size + 6]
             self.receive_buffer = self.receive_buffer[size + 6:]
+            if _type == MessageType.UDPTunnel:
+                self.last_tunnelled_voice = self.last_received
             self._dispatch_control_message(_type, message)
+            dispatched = True
+        if dispatched:
+            self._on_batch()
 
     def send_command(self, cmd: Command):
         if cmd.packet:
@@ -262,6 +278,7 @@ class ControlStack:
             with suppress(TimeoutError, Empty):
                 something = self.msg_queue.get(timeout=self.TIMEOUT)
                 if type(something) is AudioData:
+                    self.last_tunnelled_voice = monotonic()
                     self._voice_dispatcher(something)
                 else:
                     self.send_message(something.type, something.packet)
@@ -340,8 +357,10 @@ class ControlStack:
         packet = Authenticate()
         packet.username = self.user
         packet.password = self.password
+        # Kept for the next connections and for the permissions of the token groups
+        if token not in self.tokens:
+            self.tokens = [*self.tokens, token]
         packet.tokens.extend(self.tokens)
-        packet.tokens.append(token)
         packet.opus = True
         packet.client_type = self.client_type
         self.send_message(MessageType.Authenticate, packet)
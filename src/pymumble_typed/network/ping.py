@@ -53,6 +53,7 @@ class Ping:
     def __init__(self):
         self.tcp = PingStats()
         self.udp = PingStats()
+        self._reset_remote()
         self._control: ControlStack | None = None
         self._voice: VoiceStack | None = None
         self._timer = RepeatTimer(Ping.DELAY, self.send)
@@ -72,9 +73,21 @@ class Ping:
         self._timer.cancel()
         self.reset()
 
+    def _reset_remote(self):
+        # Crypt statistics of the server about the voice packets we sent, echoed in its ping replies
+        self.remote_good = 0
+        self.remote_late = 0
+        self.remote_lost = 0
+
+    def update_remote(self, good: int, late: int, lost: int):
+        self.remote_good = good
+        self.remote_late = late
+        self.remote_lost = lost
+
     def reset(self):
         self.tcp = PingStats()
         self.udp = PingStats()
+        self._reset_remote()
         if not self._timer.cancel():
             self._timer.cancel()
         self._timer = RepeatTimer(Ping.DELAY, self.send)
@@ -7,6 +7,8 @@ from pymumble_typed.protobuf.MumbleUDP_pb2 import Audio, Ping
 from pymumble_typed.sound import AudioType
 from pymumble_typed.tools import VarInt
 
+TERMINATOR_FLAG = 0x2000
+
 
 class UDPData:
     def __init__(self, is_ping: bool = True):
@@ -67,16 +69,19 @@ class PingData(UDPData):
 class AudioData(UDPData):
     def __init__(self):
         super().__init__(is_ping=False)
-        self._chunks: bytes = b""
+        self._chunks: list[bytes] = []
         self.codec: AudioType = AudioType.OPUS
         self.sequence: int = 0
         self.target: int = 0
         self.positional: [int, int, int] = [0, 0, 0]
-        self._payload = bytearray()
+        self.is_terminator: bool = False
 
     def add_chunk(self, chunk: bytes):
-        self._payload += VarInt(len(chunk)).encode() + chunk
-        self._chunks += chunk
+        self._chunks.append(chunk)
+
+    @property
+    def empty(self):
+        return not self._chunks
 
     @property
     def header(self):
@@ -84,7 +89,15 @@ class AudioData(UDPData):
 
     @property
     def payload(self):
-        return self._payload
+        payload = bytearray()
+        for chunk in self._chunks[:-1]:
+            payload += VarInt(len(chunk)).encode() + chunk
+        # The legacy format flags the end of a transmission on the size header of the last frame
+        chunk = self._chunks[-1] if self._chunks else b""
+        size = len(chunk) | (TERMINATOR_FLAG if self.is_terminator else 0)
+        if self._chunks or self.is_terminator:
+            payload += VarInt(size).encode() + chunk
+        return payload
 
     @property
     def legacy_udp_packet(self):
@@ -97,9 +110,10 @@ class AudioData(UDPData):
     @property
     def udp_packet(self):
         packet = Audio()
-        packet.opus_data = self._chunks
+        packet.opus_data = b"".join(self._chunks)
         packet.target = self.target
         packet.frame_number = self.sequence
+        packet.is_terminator = self.is_terminator
         if self.positional:
             packet.positional_data.extend(self.positional)
         return packet
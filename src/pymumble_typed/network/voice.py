@@ -13,7 +13,7 @@ from _socket import SHUT_RDWR
 from contextlib import suppress
 from socket import AF_INET, SOCK_DGRAM, gaierror, socket
 from threading import Lock, Thread
-from time import sleep, time, time_ns
+from time import monotonic, sleep, time, time_ns
 
 from pymumble_typed import MessageType, UdpMessageType
 from pymumble_typed.crypto.ocb2 import CryptStateOCB2
@@ -43,9 +43,14 @@ class VoiceStack:
         self.last_ping: PingData = PingData()
         self._extended_info = False
         self.last_good_ping = time()
+        # Monotonic time at which the last datagram was read from the socket
+        self.last_received = monotonic()
 
     def on_protocol_switch(self, func: Callable[[bool], None]):
-        self._protocol_switch_listeners.append(func)
+        self._protocol_switch_listeners = [*self._protocol_switch_listeners, func]
+
+    def remove_protocol_switch(self, func: Callable[[bool], None]):
+        self._protocol_switch_listeners = [f for f in self._protocol_switch_listeners if f != func]
 
     def crypt_setup(self, message: CryptSetup):
         self.logger.debug("setting up crypto")
@@ -81,6 +86,7 @@ class VoiceStack:
         self.ping(True, False)
         try:
             response = self.socket.recv(2048)
+            self.last_received = monotonic()
         except TimeoutError:
             self._ping_timeout()
             return
@@ -132,6 +138,7 @@ class VoiceStack:
         while self.active and not self.exit and self.control.is_connected():
             try:
                 response = self.socket.recv(512)
+                self.last_received = monotonic()
                 if response:
                     decrypted = self.ocb.decrypt(response)
                     self._dispatcher(decrypted)
@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from pymumble_typed.commands import Command
+    from pymumble_typed.mumble import Mumble
+    from pymumble_typed.protobuf.Mumble_pb2 import PermissionQuery
+    from pymumble_typed.users import User
+
+from enum import IntFlag
+
+from pymumble_typed import MessageType
+
+
+class Permission(IntFlag):
+    NONE = 0x0
+    Write = 0x1
+    Traverse = 0x2
+    Enter = 0x4
+    Speak = 0x8
+    MuteDeafen = 0x10
+    Move = 0x20
+    MakeChannel = 0x40
+    LinkChannel = 0x80
+    Whisper = 0x100
+    TextMessage = 0x200
+    MakeTempChannel = 0x400
+    Listen = 0x800
+    Kick = 0x10000
+    Ban = 0x20000
+    Register = 0x40000
+    SelfRegister = 0x80000
+    ResetUserContent = 0x100000
+    All = 0x1F0FFF
+
+
+# Granted to everybody before any ACL entry is applied
+DEFAULT_PERMISSIONS = (Permission.Traverse | Permission.Enter | Permission.Speak | Permission.Whisper
+                       | Permission.TextMessage | Permission.Listen)
+# Implied by Write
+WRITE_PERMISSIONS = (Permission.Traverse | Permission.Enter | Permission.MuteDeafen | Permission.Move
+                     | Permission.MakeChannel | Permission.LinkChannel | Permission.TextMessage
+                     | Permission.MakeTempChannel | Permission.Listen)
+# Only meaningful on the root channel, where the server checks them
+ROOT_PERMISSIONS = (Permission.Kick | Permission.Ban | Permission.Register | Permission.SelfRegister
+                    | Permission.ResetUserContent)
+ROOT_CHANNEL = 0
+SUPERUSER_ID = 0
+
+
+class PermissionDeniedError(Exception):
+    """Thrown when a command would certainly be denied by the server"""
+
+    def __init__(self, permission: Permission, channel_id: int, session: int):
+        self.permission = permission
+        self.channel_id = channel_id
+        self.session = session
+
+    def __str__(self):
+        return f"session {self.session} lacks {self.permission!r} in channel {self.channel_id}"
+
+
+class _UnknownError(Exception):
+    # The outcome depends on something the client cannot see
+    pass
+
+
+class PermissionEngine:
+    """
+    Effective permissions computed locally from the channel ACLs, the way the server does.
+
+    The ACLs of every channel from the root to the evaluated one must have been received (see Channel.request_acl),
+    otherwise the result is None: unknown. Some group memberships depend on what the client cannot see, like verified
+    certificates, the access tokens of other users or the members added to a group only temporarily, which are not
+    sent to clients. The permissions are then computed both with and without the entries of those groups: a permission
+    is known only when both agree, and check() raises only when it is denied either way. Results are cached per
+    session and channel; the cache of a user is dropped when it changes, the whole cache when any ACL or channel
+    changes.
+
+    The permissions of our own user reported by the server with PermissionQuery messages are authoritative: they are
+    kept per channel until the server flushes them, and take precedence over the local evaluation.
+    """
+
+    def __init__(self, mumble: Mumble):
+        self._mumble = mumble
+        # Least and most permissions a session may have in a channel, None when they cannot be computed
+        self._cache: dict[int, dict[int, tuple[Permission, Permission] | None]] = {}
+        self._generation = 0
+        self._reported: dict[int, Permission] = {}
+        self._queried: set[int] = set()
+
+    def invalidate(self):
+        self._generation += 1
+        self._cache = {}
+
+    def invalidate_user(self, session: int):
+        self._generation += 1
+        self._cache.pop(session, None)
+
+    def reset(self):
+        """Forget everything, for a new connection"""
+        self.invalidate()
+        self._reported = {}
+        self._queried = set()
+
+    def handle_query(self, packet: PermissionQuery):
+        # flush asks to drop every permission received so far, the message may carry the new ones of a channel
+        if packet.flush:
+            self._reported = {}
+            self._queried = set()
+        if packet.HasField("channel_id") and packet.HasField("permissions"):
+            self._reported[packet.channel_id] = Permission(packet.permissions & Permission.All)
+            self._queried.discard(packet.channel_id)
+
+    def reported(self, channel_id: int) -> Permission | None:
+        """Our permissions in the channel as last reported by the server, None if not received"""
+        return self._reported.get(channel_id)
+
+    def to_query(self, channel_ids: Iterable[int]) -> list[int]:
+        """Channels among `channel_ids` whose permissions are neither known nor already asked to the server"""
+        channel_ids = [channel_id for channel_id in dict.fromkeys(channel_ids)
+                       if channel_id not in self._reported and channel_id not in self._queried]
+        self._queried.update(channel_ids)
+        return channel_ids
+
+    def effective(self, session: int, channel_id: int) -> Permission | None:
+        bounds = self._bounds(session, channel_id)
+        if bounds is None or bounds[0] != bounds[1]:
+            return None
+        return bounds[0]
+
+    def has_permission(self, session: int, channel_id: int, permission: Permission) -> bool | None:
+        """Whether `session` has every permission in `permission` in the channel, None when it cannot be known"""
+        if permission & ROOT_PERMISSIONS:
+            channel_id = ROOT_CHANNEL
+        bounds = self._bounds(session, channel_id)
+        if bounds is None:
+            return None
+        least, most = bounds
+        if least & permission == permission:
+            return True
+        if most & permission != permission:
+            return False
+        return None
+
+    def _bounds(self, session: int, channel_id: int) -> tuple[Permission, Permission] | None:
+        myself = self._mumble.users.myself
+        if myself is not None and myself.session == session and channel_id in self._reported:
+            return self._reported[channel_id], self._reported[channel_id]
+        cached = self._cache.get(session, {})
+        if channel_id in cached:
+            return cached[channel_id]
+        generation = self._generation
+        try:
+            bounds = self._evaluate(session, channel_id, False), self._evaluate(session, channel_id, True)
+        except _UnknownError:
+            bounds = None
+        if generation == self._generation:
+            self._cache.setdefault(session, {})[channel_id] = bounds
+        return bounds
+
+    def check(self, command: Command):
+        """Raise PermissionDeniedError if the server would certainly deny the command"""
+        session = self._mumble.users.myself.session if self._mumble.users.myself else None
+        if session is None:
+            return
+        for channel_id, permission in required_permissions(self._mumble, command):
+            if self.has_permission(session, channel_id, permission) is False:
+                raise PermissionDeniedError(permission, channel_id, session)
+
+    def _acl(self, channel_id: int):
+        channel = self._mumble.channels.get(channel_id)
+        if channel is None or not channel.acl.loaded:
+            raise _UnknownError
+        return channel.acl
+
+    def _evaluate(self, session: int, channel_id: int, most: bool) -> Permission:
+        # The least permissions, or with `most` the most permissions, the uncertain group memberships allow
+        user = self._mumble.users.get(session)
+        if user is None or channel_id not in self._mumble.channels:
+            raise _UnknownError
+        if user.user_id == SUPERUSER_ID:
+            return Permission.All
+        path = self._mumble.channels.path_ids(channel_id)
+        if path[0] != ROOT_CHANNEL:
+            raise _UnknownError
+        granted = DEFAULT_PERMISSIONS
+        traverse = True
+        write = False
+        for current in path:
+            acl = self._acl(current)
+            if not acl.inherit_acls:
+                granted = DEFAULT_PERMISSIONS
+            for entry in acl.acls:
+                # Entries inherited from the parents were already applied while walking them
+                if entry.inherited:
+                    continue
+                grant = Permission(entry.grant & Permission.All)
+                deny = Permission(entry.deny & Permission.All)
+                if not (entry.user_id >= 0 and entry.user_id == user.user_id):
+                    member = self._is_member(channel_id, current, entry.group, user) if entry.group else False
+                    if member is None:
+                        # Applying only the grants gives the most permissions, only the denials the least
+                        if most:
+                            deny = Permission.NONE
+                        else:
+                            grant = Permission.NONE
+                    elif not member:
+                        continue
+                if grant & Permission.Traverse:
+                    traverse = True
+                if deny & Permission.Traverse:
+                    traverse = False
+                if grant & Permission.Write:
+                    write = True
+                if deny & Permission.Write:
+                    write = False
+                if (current == channel_id and entry.apply_here) or (current != channel_id and entry.apply_subs):
+                    granted = (granted | grant) & ~deny
+            if not traverse and not write:
+                return Permission.NONE
+        if granted & Permission.Write:
+            granted |= WRITE_PERMISSIONS
+            if channel_id == ROOT_CHANNEL:
+                granted |= Permission.Kick | Permission.Ban | Permission.Register | Permission.SelfRegister
+        return granted
+
+    def _is_member(self, channel_id: int, acl_channel_id: int, name: str, user: User) -> bool | None:
+        # Groups are evaluated in the channel being checked, or with ~ in the channel defining the ACL entry
+        invert = token = by_hash = False
+        context = channel_id
+        while name and name[0] in "!~#$":
+            match name[0]:
+                case "!":
+                    invert = True
+                case "~":
+                    context = acl_channel_id
+                case "#":
+                    token = True
+                case "$":
+                    by_hash = True
+            name = name[1:]
+
+        if token:
+            myself = self._mumble.users.myself
+            if myself is None or myself.session != user.session:
+                return None
+            member = name.lower() in (t.lower() for t in self._mumble.tokens)
+        elif by_hash:
+            member = user.hash.lower() == name.lower()
+        elif name == "none":
+            member = False
+        elif name == "all":
+            member = True
+        elif name == "auth":
+            member = user.user_id >= 0
+        elif name == "strong":
+            return None
+        elif name == "in":
+            member = user.channel_id == context
+        elif name == "out":
+            member = user.channel_id != context
+        elif name.startswith("sub"):
+            member = self._is_sub_member(channel_id, context, name[4:], user)
+        else:
+            members = self._acl(context).members(name)
+            if members is None:
+                # The ACL lists the groups inherited too, nobody can be a temporary member of a missing group
+                member = False
+            elif user.user_id >= 0 and user.user_id in members:
+                member = True
+            else:
+                # The user may still be a temporary member of the group
+                return None
+        return member != invert
+
+    def _is_sub_member(self, channel_id: int, context: int, arguments: str, user: User) -> bool:
+        # sub,<minpath>,<mindesc>,<maxdesc>: users in the sub-channels of the context, within the given depths
+        limits = [0, 1, 1000]
+        for i, argument in enumerate(arguments.split(",")[:3]):
+            if argument.lstrip("-").isdigit():
+                limits[i] = int(argument)
+        min_path, min_desc, max_desc = limits
+        user_chain = self._mumble.channels.path_ids(user.channel_id)
+        group_chain = self._mumble.channels.path_ids(channel_id)
+        if context not in group_chain:
+            return False
+        offset = max(group_chain.index(context) + min_path, 0)
+        if offset >= len(group_chain) or group_chain[offset] not in user_chain:
+            return False
+        depth = len(user_chain) - 1
+        return offset + min_desc <= depth <= offset + max_desc
+
+
+def required_permissions(mumble: Mumble, command: Command) -> list[tuple[int, Permission]]:
+    """Permissions, with the channel they are checked in, that the server requires to execute a command"""
+    packet = command.packet
+    myself = mumble.users.myself
+    match command.type:
+        case MessageType.UserState:
+            user = mumble.users.get(packet.session)
+            if user is None:
+                return []
+            required = []
+            if packet.HasField("channel_id") and packet.channel_id != user.channel_id:
+                if myself is not None and user.session == myself.session:
+                    required.append((packet.channel_id, Permission.Enter))
+                else:
+                    required += [(user.channel_id, Permission.Move), (packet.channel_id, Permission.Move)]
+            if packet.HasField("mute") or packet.HasField("deaf") or packet.HasField("suppress"):
+                required.append((user.channel_id, Permission.MuteDeafen))
+            if myself is None or user.session != myself.session:
+                if packet.HasField("comment") or packet.HasField("texture"):
+                    required.append((ROOT_CHANNEL, Permission.ResetUserContent))
+                if packet.HasField("user_id"):
+                    required.append((ROOT_CHANNEL, Permission.Register))
+            elif packet.HasField("user_id"):
+                required.append((ROOT_CHANNEL, Permission.SelfRegister))
+            return required
+        case MessageType.UserRemove:
+            return [(ROOT_CHANNEL, Permission.Ban if packet.ban else Permission.Kick)]
+        case MessageType.TextMessage:
+            return [(channel_id, Permission.TextMessage) for channel_id in packet.channel_id]
+        case MessageType.ChannelState:
+            if not packet.HasField("channel_id"):
+                permission = Permission.MakeTempChannel if packet.temporary else Permission.MakeChannel
+                return [(packet.parent, permission)]
+            required = []
+            if packet.HasField("name") or packet.HasField("description") or packet.HasField("position"):
+                required.append((packet.channel_id, Permission.Write))
+            if packet.HasField("parent"):
+                required += [(packet.channel_id, Permission.Write), (packet.parent, Permission.MakeChannel)]
+            if packet.links_add or packet.links_remove:
+                required.append((packet.channel_id, Permission.LinkChannel))
+                required += [(channel_id, Permission.LinkChannel) for channel_id in packet.links_add]
+            return required
+        case MessageType.ChannelRemove | MessageType.ACL:
+            return [(packet.channel_id, Permission.Write)]
+    return []
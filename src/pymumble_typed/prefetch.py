@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pymumble_typed.mumble import Mumble
+
+from enum import IntEnum
+from time import monotonic
+
+from pymumble_typed.blob_requests import BlobKind
+
+# UserState fields that only carry blobs, a UserState with nothing else is not activity of the user
+BLOB_FIELDS = frozenset({"session", "actor", "comment", "comment_hash", "texture", "texture_hash"})
+
+
+class PrefetchPriority(IntEnum):
+    MY_CHANNEL = 0
+    TALKING = 1
+    RECENTLY_ACTIVE = 2
+    OTHER_USER = 3
+    OTHER_CHANNEL = 4
+
+
+class PrefetchPolicy:
+    """
+    Order in which blobs are prefetched, and the bandwidth they may use.
+
+    Blobs of our own channel and of the users in it come first, then the ones of the users talking, of the users
+    recently active and finally everything else. Prefetching uses at most `budget` bytes per second, charged with the
+    estimated size of the blobs and corrected when they are received, and it is paused while voice goes through the
+    control connection, where blobs would delay it.
+    Blobs that something is waiting for are not prefetched: they are always requested first, regardless of the budget.
+    """
+
+    def __init__(self, mumble: Mumble, budget: int = 65536, talking: float = 5., recent: float = 300.,
+                 tunnel_hold: float = 1.):
+        self._mumble = mumble
+        self.budget = budget
+        self.talking = talking
+        self.recent = recent
+        self.tunnel_hold = tunnel_hold
+        self._tokens = 0.
+        self._refilled = monotonic()
+        self._last_voice: dict[int, float] = {}
+        self._last_activity: dict[int, float] = {}
+
+    def note_voice(self, session: int):
+        self._last_voice[session] = monotonic()
+
+    def note_activity(self, session: int):
+        self._last_activity[session] = monotonic()
+
+    def forget(self, session: int):
+        self._last_voice.pop(session, None)
+        self._last_activity.pop(session, None)
+
+    def reset(self):
+        self._last_voice = {}
+        self._last_activity = {}
+
+    def paused(self, now: float) -> bool:
+        return now - self._mumble.tunnelled_voice_at < self.tunnel_hold
+
+    def priority(self, kind: BlobKind, _id: int, now: float) -> PrefetchPriority:
+        myself = self._mumble.users.myself
+        my_channel = myself.channel_id if myself is not None else None
+        if kind == BlobKind.DESCRIPTION:
+            return PrefetchPriority.MY_CHANNEL if _id == my_channel else PrefetchPriority.OTHER_CHANNEL
+        user = self._mumble.users.get(_id)
+        if user is not None and user.channel_id == my_channel:
+            return PrefetchPriority.MY_CHANNEL
+        if now - self._last_voice.get(_id, -self.talking) < self.talking:
+            return PrefetchPriority.TALKING
+        if now - self._last_activity.get(_id, -self.recent) < self.recent:
+            return PrefetchPriority.RECENTLY_ACTIVE
+        return PrefetchPriority.OTHER_USER
+
+    def _refill(self, now: float, burst: int):
+        self._tokens = min(self._tokens + (now - self._refilled) * self.budget, max(self.budget, burst))
+        self._refilled = now
+
+    def available(self, now: float, size: int) -> bool:
+        """Whether the budget allows a blob of `size` bytes now"""
+        self._refill(now, size)
+        return self._tokens >= size
+
+    def consume(self, size: int):
+        self._tokens -= size
+
+    def credit(self, size: int):
+        """Give back bytes consumed by a blob smaller than estimated, or charge more when negative"""
+        self._tokens += size
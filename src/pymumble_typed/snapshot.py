@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from pymumble_typed.channels import Channels
+    from pymumble_typed.users import Users
+
+from threading import Lock
+from types import MappingProxyType
+
+
+class UserSnapshot(NamedTuple):
+    session: int
+    name: str
+    hash: str
+    channel_id: int
+    priority_speaker: bool
+    muted: bool
+    self_muted: bool
+    deaf: bool
+    self_deaf: bool
+    suppressed: bool
+    is_recording: bool
+    comment_hash: bytes
+    texture_hash: bytes
+
+
+class ChannelSnapshot(NamedTuple):
+    id: int
+    name: str
+    parent_id: int | None
+    position: int
+    max_users: int
+    temporary: bool
+    links: tuple[int, ...]
+    description_hash: bytes
+
+
+class Snapshot:
+    """
+    Immutable view of users and channels, consistent with the end of a batch of control messages.
+
+    Snapshots are never changed once published, so they can be read from any thread without locks. Indexes are built
+    on first use and kept with the snapshot.
+    """
+
+    def __init__(self, version: int, users: Mapping[int, UserSnapshot], channels: Mapping[int, ChannelSnapshot]):
+        self.version = version
+        self.users: Mapping[int, UserSnapshot] = MappingProxyType(users)
+        self.channels: Mapping[int, ChannelSnapshot] = MappingProxyType(channels)
+        self._by_channel: dict[int, tuple[UserSnapshot, ...]] | None = None
+        self._by_name: dict[str, UserSnapshot] | None = None
+        self._children: dict[int, tuple[ChannelSnapshot, ...]] | None = None
+
+    def users_in_channel(self, channel_id: int) -> tuple[UserSnapshot, ...]:
+        if self._by_channel is None:
+            by_channel: dict[int, list[UserSnapshot]] = {}
+            for user in self.users.values():
+                by_channel.setdefault(user.channel_id, []).append(user)
+            self._by_channel = {channel: tuple(users) for channel, users in by_channel.items()}
+        return self._by_channel.get(channel_id, ())
+
+    def user_by_name(self, name: str) -> UserSnapshot | None:
+        if self._by_name is None:
+            self._by_name = {user.name.lower(): user for user in self.users.values()}
+        return self._by_name.get(name.lower())
+
+    def children(self, channel_id: int) -> tuple[ChannelSnapshot, ...]:
+        if self._children is None:
+            children: dict[int, list[ChannelSnapshot]] = {}
+            for channel in self.channels.values():
+                if channel.parent_id is not None:
+                    children.setdefault(channel.parent_id, []).append(channel)
+            self._children = {
+                parent: tuple(sorted(channels, key=lambda channel: (channel.position, channel.name)))
+                for parent, channels in children.items()
+            }
+        return self._children.get(channel_id, ())
+
+
+EMPTY_SNAPSHOT = Snapshot(0, {}, {})
+
+
+class SnapshotPublisher:
+    """
+    Publish a new Snapshot after every batch of control messages that changed users or channels.
+
+    Only the entries changed by the batch are rebuilt, the others are shared with the previous snapshot.
+    """
+
+    def __init__(self):
+        self._snapshot = EMPTY_SNAPSHOT
+        self._lock = Lock()
+
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+
+    def publish(self, users: Users, channels: Channels) -> Snapshot:
+        with self._lock:
+            user_changes = users.take_changes()
+            channel_changes = channels.take_changes()
+            if user_changes is None and channel_changes is None:
+                return self._snapshot
+            previous = self._snapshot
+            self._snapshot = Snapshot(previous.version + 1, _apply(previous.users, user_changes),
+                                      _apply(previous.channels, channel_changes))
+            return self._snapshot
+
+    def reset(self):
+        """Start again from an empty state, for a new connection"""
+        with self._lock:
+            self._snapshot = Snapshot(self._snapshot.version + 1, {}, {})
+
+
+def _apply(entries: Mapping, changes: dict | None) -> dict:
+    # Changes map keys to the new entry, or to None for removed ones
+    entries = dict(entries)
+    for key, entry in (changes or {}).items():
+        if entry is None:
+            entries.pop(key, None)
+        else:
+            entries[key] = entry
+    return entries
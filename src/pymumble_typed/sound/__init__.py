@@ -31,3 +31,9 @@ class CodecProfile(str, Enum):
     Audio = "audio"
     Voip = "voip"
     RestrictedLowDelay = "restricted_lowdelay"
+
+
+class Signal(IntEnum):
+    Auto = -1000
+    Voice = 3001
+    Music = 3002
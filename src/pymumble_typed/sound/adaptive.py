@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, TypedDict
+
+if TYPE_CHECKING:
+    from logging import Logger
+
+    from pymumble_typed.network.ping import Ping, PingStats
+    from pymumble_typed.network.voice import VoiceStack
+    from pymumble_typed.sound.encoder import Encoder
+
+from collections import deque
+from math import ceil, sqrt
+
+from pymumble_typed.network.ping import RepeatTimer
+
+FEC_LOSS_DECAY = 0.5
+# Pings the jitter is measured over, a ping is sent every Ping.DELAY seconds
+JITTER_PINGS = 4
+
+
+class BitrateDecision(TypedDict):
+    transport: str
+    loss: float
+    late: float
+    jitter: float | None
+    bitrate: int
+    max_bitrate: int
+    inband_fec: bool
+    packet_loss_perc: int
+    reason: str
+
+
+class _RTTWindow:
+    """
+    Round trip time jitter over the last `size` pings.
+
+    Pings are sent every Ping.DELAY seconds, less often than the updates, so the window spans several updates.
+    """
+
+    def __init__(self, size: int = JITTER_PINGS):
+        self._size = size
+        self._number = 0
+        self._total = 0.
+        self._total_square = 0.
+        # Count, sum and sum of squares of the round trip times received during each update
+        self._chunks: deque[tuple[int, float, float]] = deque()
+
+    def update(self, stats: PingStats) -> float | None:
+        number = stats.number
+        total = stats.average * number
+        total_square = stats.average_square * number
+        if number < self._number:
+            # The statistics were reset by a reconnection
+            self._number = 0
+            self._total = 0.
+            self._total_square = 0.
+            self._chunks.clear()
+        if number > self._number:
+            self._chunks.append((number - self._number, total - self._total, total_square - self._total_square))
+        self._number, self._total, self._total_square = number, total, total_square
+        while len(self._chunks) > 1 and sum(chunk[0] for chunk in self._chunks) - self._chunks[0][0] >= self._size:
+            self._chunks.popleft()
+        count = sum(chunk[0] for chunk in self._chunks)
+        if count < 2:
+            return None
+        mean = sum(chunk[1] for chunk in self._chunks) / count
+        variance = sum(chunk[2] for chunk in self._chunks) / count - mean * mean
+        return sqrt(max(variance, 0.))
+
+
+class _LossWindow:
+    """Share of late and lost voice packets since the previous update"""
+
+    def __init__(self):
+        self._counters = (0, 0, 0)
+
+    def update(self, good: int, late: int, lost: int) -> tuple[float, float]:
+        previous = self._counters if all(c >= p for c, p in zip((good, late, lost), self._counters)) else (0, 0, 0)
+        self._counters = (good, late, lost)
+        good, late, lost = (c - p for c, p in zip(self._counters, previous))
+        total = good + late + lost
+        if not total:
+            return 0., 0.
+        return lost / total, late / total
+
+
+class AdaptiveBitrate:
+    """
+    Periodically adapt the encoder to the state of the network.
+
+    The loss reported by the server for the packets we sent (or, until it reports any, the one we measure on the
+    packets we receive) is measured over every interval, the round trip time jitter over the last pings. On congestion
+    the bitrate is lowered by `decrease`, once the link is clean again it grows back by `increase` up to the bitrate
+    allowed by the bandwidth. While voice is tunnelled over TCP, retransmissions hide the loss but add latency, so the
+    bitrate is capped to `tcp_ratio` of the maximum and FEC is disabled. Otherwise in-band FEC is enabled as soon as
+    loss is measured, tuned for the observed loss.
+
+    The network is measured once per interval and the decision applied to the main encoder and to every encoder added
+    with add_encoder, each within the bandwidth it is given.
+    """
+
+    def __init__(self, ping: Ping, logger: Logger, interval: float = 5., min_bitrate: int = 12000,
+                 decrease: float = 0.7, increase: float = 1.1, loss_low: float = 0.01, loss_high: float = 0.05,
+                 jitter_high: float = 40., tcp_ratio: float = 0.5, max_packet_loss_perc: int = 25):
+        self._ping = ping
+        self._interval = interval
+        self._min_bitrate = min_bitrate
+        self._decrease = decrease
+        self._increase = increase
+        self._loss_low = loss_low
+        self._loss_high = loss_high
+        self._jitter_high = jitter_high
+        self._tcp_ratio = tcp_ratio
+        self._max_packet_loss_perc = max_packet_loss_perc
+        self._voice: VoiceStack | None = None
+        self._encoder: Encoder | None = None
+        self._encoders: list[Encoder] = []
+        self._logger = logger.getChild(self.__class__.__name__)
+        self._timer: RepeatTimer | None = None
+        self.last_decision: BitrateDecision | None = None
+        self.reset()
+
+    def set_voice(self, voice: VoiceStack):
+        self._voice = voice
+
+    def set_encoder(self, encoder: Encoder):
+        self._encoder = encoder
+
+    def add_encoder(self, encoder: Encoder):
+        self._encoders = [*self._encoders, encoder]
+
+    def remove_encoder(self, encoder: Encoder):
+        self._encoders = [e for e in self._encoders if e is not encoder]
+
+    def start(self):
+        if not self._voice or not self._encoder:
+            raise Exception(f"Cannot start adaptive bitrate. VoiceStack = {self._voice}, Encoder = {self._encoder}")
+        self._timer.start()
+
+    def cancel(self):
+        self._timer.cancel()
+
+    def reset(self):
+        # A cancelled timer cannot be started again, a new one is needed for the next connection
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = RepeatTimer(self._interval, self.update)
+        self._udp = _RTTWindow()
+        self._tcp = _RTTWindow()
+        self._remote = _LossWindow()
+        self._local = _LossWindow()
+        self._fec_loss = 0.
+
+    def _loss(self) -> tuple[float, float]:
+        remote = self._ping.remote_good, self._ping.remote_late, self._ping.remote_lost
+        local = self._voice.ocb.ui_good, self._voice.ocb.ui_late, self._voice.ocb.ui_lost
+        remote_loss = self._remote.update(*remote)
+        local_loss = self._local.update(*local)
+        return remote_loss if any(remote) else local_loss
+
+    def update(self):
+        if not self._voice or not self._encoder:
+            return
+        tcp = not self._voice.active
+        udp_jitter = self._udp.update(self._ping.udp)
+        tcp_jitter = self._tcp.update(self._ping.tcp)
+        jitter = tcp_jitter if tcp else udp_jitter
+        loss, late = (0., 0.) if tcp else self._loss()
+
+        # FEC follows a decaying peak of the loss, so it is not switched off by a single clean interval
+        self._fec_loss = 0. if tcp else max(loss, self._fec_loss * FEC_LOSS_DECAY)
+        inband_fec = self._fec_loss >= self._loss_low
+        packet_loss_perc = min(ceil(self._fec_loss * 100), self._max_packet_loss_perc) if inband_fec else 0
+
+        self.last_decision = self._adapt(self._encoder, tcp, loss, late, jitter, inband_fec, packet_loss_perc)
+        for encoder in self._encoders:
+            self._adapt(encoder, tcp, loss, late, jitter, inband_fec, packet_loss_perc)
+
+    def _adapt(self, encoder: Encoder, tcp: bool, loss: float, late: float, jitter: float | None, inband_fec: bool,
+               packet_loss_perc: int) -> BitrateDecision:
+        max_bitrate = encoder.max_bitrate
+        ceiling = int(max_bitrate * self._tcp_ratio) if tcp else max_bitrate
+        current = min(encoder.bitrate, ceiling)
+        congested = jitter is not None and jitter >= self._jitter_high
+        if loss + late >= self._loss_high or congested:
+            bitrate = int(current * self._decrease)
+            reason = "jitter" if congested else "loss"
+        elif loss + late <= self._loss_low:
+            bitrate = int(current * self._increase)
+            reason = "clean"
+        else:
+            bitrate = current
+            reason = "hold"
+        bitrate = max(min(bitrate, ceiling), min(self._min_bitrate, ceiling))
+
+        encoder.target_bitrate = None if bitrate >= max_bitrate else bitrate
+        settings = encoder.settings
+        if settings.get("inband_fec", False) != inband_fec or settings.get("packet_loss_perc", 0) != packet_loss_perc:
+            encoder.configure(inband_fec=inband_fec, packet_loss_perc=packet_loss_perc)
+
+        decision = BitrateDecision(
+            transport="tcp" if tcp else "udp", loss=loss, late=late, jitter=jitter, bitrate=bitrate,
+            max_bitrate=max_bitrate, inband_fec=inband_fec, packet_loss_perc=packet_loss_perc, reason=reason
+        )
+        self._logger.info(
+            f"transport={decision['transport']} loss={loss:.4f} late={late:.4f} "
+            f"jitter={'n/a' if jitter is None else f'{jitter:.1f}'} bitrate={current}->{bitrate} "
+            f"max_bitrate={max_bitrate} inband_fec={inband_fec} packet_loss_perc={packet_loss_perc} reason={reason}"
+        )
+        return decision
@@ -6,17 +6,131 @@ if TYPE_CHECKING:
     from collections.abc import Callable
     from logging import Logger
 
-from time import time
+from enum import IntEnum
+from time import monotonic, time
 
-from pymumble_typed.sound import AudioType
+from pymumble_typed.sound import SAMPLE_RATE, AudioType
+
+
+class OpusMode(IntEnum):
+    Silk = 0
+    Hybrid = 1
+    Celt = 2
+
+
+class OpusBandwidth(IntEnum):
+    # Audio bandwidth in Hz
+    Narrowband = 4000
+    Mediumband = 6000
+    Wideband = 8000
+    SuperWideband = 12000
+    Fullband = 20000
+
+
+def _toc_table() -> list[tuple[OpusMode, OpusBandwidth, int]]:
+    # RFC 6716, section 3.1: the configuration number is the upper 5 bits of the TOC byte
+    silk = [OpusBandwidth.Narrowband, OpusBandwidth.Mediumband, OpusBandwidth.Wideband]
+    celt = [OpusBandwidth.Narrowband, OpusBandwidth.Wideband, OpusBandwidth.SuperWideband, OpusBandwidth.Fullband]
+    table = []
+    for config in range(32):
+        if config < 12:
+            entry = (OpusMode.Silk, silk[config // 4], (480, 960, 1920, 2880)[config % 4])
+        elif config < 16:
+            bandwidth = OpusBandwidth.SuperWideband if config < 14 else OpusBandwidth.Fullband
+            entry = (OpusMode.Hybrid, bandwidth, (480, 960)[config % 2])
+        else:
+            entry = (OpusMode.Celt, celt[(config - 16) // 4], (120, 240, 480, 960)[config % 4])
+        table.append(entry)
+    return table
+
+
+_TOC_TABLE = _toc_table()
+
+
+class OpusTOC:
+    """Information carried by the table-of-contents byte of an Opus packet, available without decoding it"""
+
+    def __init__(self, data: bytes):
+        if not data:
+            self.config = -1
+            self.mode: OpusMode | None = None
+            self.bandwidth: OpusBandwidth | None = None
+            self.stereo = False
+            self.frame_samples = 0
+            self.frame_count = 0
+            return
+        toc = data[0]
+        self.config = toc >> 3
+        self.mode, self.bandwidth, self.frame_samples = _TOC_TABLE[self.config]
+        self.stereo = bool(toc & 0x04)
+        code = toc & 0x03
+        if code == 0:
+            self.frame_count = 1
+        elif code < 3:
+            self.frame_count = 2
+        else:
+            self.frame_count = data[1] & 0x3F if len(data) > 1 else 0
+
+    @property
+    def samples(self) -> int:
+        """Samples per channel carried by the packet, at 48kHz"""
+        return self.frame_count * self.frame_samples
+
+    @property
+    def frame_duration(self) -> float:
+        return self.frame_samples / SAMPLE_RATE
+
+    @property
+    def duration(self) -> float:
+        return self.samples / SAMPLE_RATE
+
+    @property
+    def channels(self) -> int:
+        return 2 if self.stereo else 1
 
 
 class OpusPacket:
-    def __init__(self, data: bytes, sequence: int, target: int, timestamp: float = time()):
-        self.data = data
-        self.sequence = sequence
-        self.target = target
-        self.timestamp = timestamp
+    """
+    Immutable record of a received Opus packet.
+
+    `data` is the payload as handed over by the parser: a memoryview on the received datagram when it can be sliced
+    without copying, bytes otherwise. `timestamp` is the monotonic time at which the datagram carrying it was read
+    from the socket.
+    """
+
+    __slots__ = ("_toc", "data", "frame_number", "is_terminator", "session", "target", "timestamp", "volume_adjustment")
+
+    def __init__(self, data: bytes | memoryview, frame_number: int, target: int, timestamp: float | None = None,
+                 volume_adjustment: float = 1., is_terminator: bool = False, session: int = 0):
+        init = object.__setattr__
+        init(self, "data", data)
+        init(self, "frame_number", frame_number)
+        init(self, "target", target)
+        init(self, "timestamp", monotonic() if timestamp is None else timestamp)
+        init(self, "volume_adjustment", volume_adjustment)
+        init(self, "is_terminator", is_terminator)
+        init(self, "session", session)
+        init(self, "_toc", None)
+
+    def __setattr__(self, name: str, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name: str):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __repr__(self):
+        return (f"OpusPacket(session={self.session}, frame_number={self.frame_number}, size={len(self.data)}, "
+                f"is_terminator={self.is_terminator})")
+
+    @property
+    def sequence(self) -> int:
+        return self.frame_number
+
+    @property
+    def toc(self) -> OpusTOC:
+        if self._toc is None:
+            object.__setattr__(self, "_toc", OpusTOC(self.data))
+        return self._toc
 
 
 class Audio:
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import numpy as np
+
+from pymumble_typed.sound import CHANNELS, SAMPLE_RATE
+from pymumble_typed.sound.resample import Resampler, to_int16
+
+# Input frames converted at once: the resampler gathers a window of taps per output sample, bounding the chunk keeps
+# that temporary small even when a whole file is passed in a single call
+CHUNK_FRAMES = 16384
+
+# Multiplier bringing every supported sample format to the int16 range, plus the offset of the unsigned ones
+_SCALES = {
+    np.dtype(np.int16): (1., 0),
+    np.dtype(np.int32): (1 / 65536, 0),
+    np.dtype(np.uint8): (256., 128),
+    np.dtype(np.float32): (32768., 0),
+    np.dtype(np.float64): (32768., 0),
+}
+
+
+def mix_matrix(src_channels: int, dst_channels: int) -> np.ndarray:
+    """Matrix mapping frames with `src_channels` to `dst_channels` with a single product"""
+    if src_channels == 1:
+        return np.ones((1, dst_channels), dtype=np.float32)
+    if dst_channels == 1:
+        return np.full((src_channels, 1), 1 / src_channels, dtype=np.float32)
+    return np.eye(src_channels, dst_channels, dtype=np.float32)
+
+
+class PCMConverter:
+    """
+    Convert a stream of audio in any supported format to interleaved int16 PCM at the output rate and channels.
+
+    Samples are converted to float, mixed to the output channels and resampled, in chunks, with numpy. The resampler
+    keeps its state between calls, so a stream can be converted in pieces of any size without clicks at the
+    boundaries. `flush` returns the samples still held back by the filter at the end of the stream.
+    """
+
+    def __init__(self, sample_rate: int, channels: int, dtype: np.dtype | str = np.int16,
+                 dst_sample_rate: int = SAMPLE_RATE, dst_channels: int = CHANNELS):
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in _SCALES:
+            raise ValueError(f"Unsupported sample format: {self.dtype}. It must be one of {list(map(str, _SCALES))}.")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.dst_sample_rate = dst_sample_rate
+        self.dst_channels = dst_channels
+        self._matrix = None if channels == dst_channels else mix_matrix(channels, dst_channels)
+        # Mixing before resampling when reducing channels, after when increasing them, resamples fewer channels
+        self._mix_first = dst_channels < channels
+        self._resampler = Resampler(sample_rate, dst_sample_rate, min(channels, dst_channels))
+        self.reset()
+
+    def reset(self):
+        self._resampler.reset()
+        # Bytes of a partial frame received at the end of the previous buffer
+        self._remainder = b""
+        self._input_frames = 0
+        self._output_frames = 0
+
+    def _frames(self, data: np.ndarray | bytes | bytearray | memoryview) -> np.ndarray:
+        if isinstance(data, np.ndarray):
+            if data.dtype not in _SCALES:
+                raise ValueError(f"Unsupported sample format: {data.dtype}")
+            return data.reshape(-1, self.channels)
+        frame_size = self.dtype.itemsize * self.channels
+        if self._remainder:
+            data = self._remainder + bytes(data)
+        usable = len(data) // frame_size * frame_size
+        self._remainder = bytes(data[usable:])
+        return np.frombuffer(data, dtype=self.dtype, count=usable // self.dtype.itemsize).reshape(-1, self.channels)
+
+    def _mix(self, pcm: np.ndarray) -> np.ndarray:
+        return pcm if self._matrix is None else pcm @ self._matrix
+
+    def _convert(self, pcm: np.ndarray) -> np.ndarray:
+        scale, offset = _SCALES[pcm.dtype]
+        pcm = pcm.astype(np.float32)
+        if offset:
+            pcm -= offset
+        if scale != 1.:
+            pcm *= scale
+        if self._mix_first:
+            return self._resampler.process(self._mix(pcm))
+        return self._mix(self._resampler.process(pcm))
+
+    def process(self, data: np.ndarray | bytes | bytearray | memoryview) -> bytes:
+        """Convert a buffer in the input format, or an array shaped (frames,) or (frames, channels)"""
+        frames = self._frames(data)
+        if frames.dtype == np.int16 and self._matrix is None and self._resampler.passthrough:
+            return frames.tobytes()
+        chunks = [self._convert(frames[i:i + CHUNK_FRAMES]) for i in range(0, len(frames), CHUNK_FRAMES)]
+        if not chunks:
+            return b""
+        pcm = np.concatenate(chunks)
+        self._input_frames += len(frames)
+        self._output_frames += len(pcm)
+        return to_int16(pcm).tobytes()
+
+    def flush(self) -> bytes:
+        """Return the end of the stream held back by the filter delay and get ready for a new stream"""
+        tail = np.empty((0, self.dst_channels), dtype=np.float32)
+        if not self._resampler.passthrough:
+            # The resampler is flushed with zeros, only the output matching the real input is kept
+            missing = self._input_frames * self.dst_sample_rate // self.sample_rate - self._output_frames
+            tail = self._resampler.flush()[:max(missing, 0)]
+            if not self._mix_first:
+                tail = self._mix(tail)
+        self.reset()
+        return to_int16(tail).tobytes()
@@ -5,3 +5,42 @@ from __future__ import annotations
 #   decoded, resulting in a huge CPU waste.
 #   So we need to help the user to decode by itself the packets, only when they are effectively needed!
 #   The hard part is that an Audio Packet may depend on the following or on the previous one.
+from opuslib import Decoder as OpusDecoder
+from opuslib import OpusError
+
+from pymumble_typed.sound import CHANNELS, SAMPLE_RATE
+
+# Longest duration an Opus packet can carry (120ms)
+MAX_FRAME_DURATION = 0.12
+
+
+class Decoder:
+    def __init__(self, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS):
+        self._sample_rate = sample_rate
+        self._channels = channels
+        self._max_frame_size = int(MAX_FRAME_DURATION * sample_rate)
+        self._decoder = OpusDecoder(sample_rate, channels)
+
+    def decode(self, data: bytes) -> bytes:
+        try:
+            return self._decoder.decode(bytes(data), self._max_frame_size)
+        except OpusError:
+            return b""
+
+    def conceal(self, samples: int) -> bytes:
+        # An empty payload asks the decoder for packet loss concealment
+        try:
+            return self._decoder.decode(b"", samples)
+        except OpusError:
+            return b"\x00" * (samples * self._channels * 2)
+
+    def reset(self):
+        self._decoder.reset_state()
+
+    @property
+    def sample_rate(self):
+        return self._sample_rate
+
+    @property
+    def channels(self):
+        return self._channels
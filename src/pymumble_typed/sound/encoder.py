@@ -1,10 +1,58 @@
+from ctypes import c_char
 from threading import Lock
+from time import perf_counter
+from typing import TypedDict
 
 from opuslib import Encoder as OpusEncoder
 from opuslib import OpusError
+from opuslib.api import ctl
+from opuslib.api.encoder import encode as opus_encode
+from opuslib.api.encoder import encoder_ctl
 
 from pymumble_typed.network.voice import VoiceStack
-from pymumble_typed.sound import AUDIO_PER_PACKET, BANDWIDTH, CHANNELS, SAMPLE_RATE, CodecProfile
+from pymumble_typed.sound import AUDIO_PER_PACKET, BANDWIDTH, CHANNELS, SAMPLE_RATE, CodecProfile, Signal
+
+
+class EncoderSettings(TypedDict, total=False):
+    complexity: int  # 0-10, the main lever for the CPU used by the encoder
+    vbr: bool
+    vbr_constraint: bool
+    inband_fec: bool
+    packet_loss_perc: int  # 0-100, expected loss the in-band FEC is tuned for
+    signal: Signal
+
+
+class EncoderStats(TypedDict):
+    profile: str | None
+    settings: EncoderSettings
+    bitrate: int
+    target_bitrate: int | None
+    bandwidth: int
+    dtx: bool
+    frames: int
+    bytes: int
+    encode_time: float
+
+
+PROFILES: dict[str, EncoderSettings] = {
+    "low-cpu": EncoderSettings(complexity=2, vbr=True, vbr_constraint=False, inband_fec=False, packet_loss_perc=0,
+                               signal=Signal.Auto),
+    "balanced": EncoderSettings(complexity=6, vbr=True, vbr_constraint=True, inband_fec=True, packet_loss_perc=5,
+                                signal=Signal.Auto),
+    "max-quality": EncoderSettings(complexity=10, vbr=True, vbr_constraint=False, inband_fec=True,
+                                   packet_loss_perc=10, signal=Signal.Auto),
+}
+
+# opuslib's inband_fec and dtx setters do not pass the value to the CTL, so every setting is applied directly
+_SETTING_CTLS = {
+    "complexity": ctl.set_complexity,
+    "vbr": ctl.set_vbr,
+    "vbr_constraint": ctl.set_vbr_constraint,
+    "inband_fec": ctl.set_inband_fec,
+    "packet_loss_perc": ctl.set_packet_loss_perc,
+    "signal": ctl.set_signal,
+}
+_SETTING_RANGES = {"complexity": range(11), "packet_loss_perc": range(101)}
 
 
 class Encoder:
@@ -16,16 +64,79 @@ class Encoder:
         self._codec_profile: CodecProfile = CodecProfile.Audio
         self._encoder: OpusEncoder = OpusEncoder(self._sample_rate, self._channels, self._codec_profile)
         self._bandwidth: int = BANDWIDTH
+        self._dtx: bool = False
+        self._target_bitrate: int | None = None
+        self._profile: str | None = None
+        self._settings: EncoderSettings = EncoderSettings()
+        self._frames = 0
+        self._bytes = 0
+        self._encode_time = 0.
         self._samples = int(self.encoder_framesize * self._sample_rate * self.sample_size)
         self._encoder_ready = Lock()
         self._voice = voice
         voice.on_protocol_switch(self._recalc_bitrate)
 
+    def close(self):
+        self._voice.remove_protocol_switch(self._recalc_bitrate)
+
     def _update_encoder(self):
         self._encoder_ready.acquire(blocking=True)
         self._encoder: OpusEncoder = OpusEncoder(self._sample_rate, self._channels, self._codec_profile)
+        self._apply_settings()
         self._encoder_ready.release()
 
+    def _apply_settings(self):
+        # A rebuilt Opus encoder starts from the libopus defaults, everything configured is applied again
+        state = self._encoder.encoder_state
+        encoder_ctl(state, ctl.set_dtx, int(self._dtx))
+        for name, value in self._settings.items():
+            encoder_ctl(state, _SETTING_CTLS[name], int(value))
+        self._encoder.bitrate = self._calc_bitrate()
+
+    def set_profile(self, profile: str | None, **overrides):
+        """Apply a named profile from PROFILES, with per-field overrides. None goes back to the libopus defaults"""
+        if profile is not None and profile not in PROFILES:
+            raise ValueError(f"Unknown encoder profile: {profile}. It must be one of {list(PROFILES)}.")
+        settings = EncoderSettings(PROFILES[profile]) if profile else EncoderSettings()
+        self._validate(overrides)
+        settings.update(overrides)
+        self._profile = profile
+        self._configure(settings, reset=True)
+
+    def configure(self, **settings):
+        """Change single encoder settings, keeping the others"""
+        self._validate(settings)
+        self._configure(EncoderSettings({**self._settings, **settings}), reset=False)
+
+    @staticmethod
+    def _validate(settings: dict):
+        for name, value in settings.items():
+            if name not in _SETTING_CTLS:
+                raise ValueError(f"Unknown encoder setting: {name}")
+            if name in _SETTING_RANGES and value not in _SETTING_RANGES[name]:
+                raise ValueError(f"Invalid {name}: {value}")
+
+    def _configure(self, settings: EncoderSettings, reset: bool):
+        with self._encoder_ready:
+            self._settings = settings
+            if reset:
+                # Settings dropped by the new profile must go back to their defaults too
+                self._encoder = OpusEncoder(self._sample_rate, self._channels, self._codec_profile)
+            self._apply_settings()
+
+    @property
+    def profile(self):
+        return self._profile
+
+    @property
+    def settings(self) -> EncoderSettings:
+        return EncoderSettings(self._settings)
+
+    def stats(self) -> EncoderStats:
+        return EncoderStats(profile=self._profile, settings=self.settings, bitrate=self._calc_bitrate(),
+                            target_bitrate=self._target_bitrate, bandwidth=self._bandwidth, dtx=self._dtx,
+                            frames=self._frames, bytes=self._bytes, encode_time=self._encode_time)
+
     def _recalc_bitrate(self, _: bool):
         self._encoder.bitrate = self._calc_bitrate()
 
@@ -41,17 +152,41 @@ class Encoder:
         self._calc_sample_size()
         self._samples = int(self.encoder_framesize * self._sample_rate * self._sample_size)
 
-    def encode(self, pcm: bytes) -> bytes:
-        if len(pcm) < self._samples:
-            pcm += b'\x00' * (self._samples - len(pcm))
+    def encode(self, pcm: bytes | memoryview) -> bytes:
+        size = len(pcm)
+        if size < self._samples:
+            pcm = bytes(pcm) + b'\x00' * (self._samples - size)
+            size = self._samples
+        elif isinstance(pcm, memoryview):
+            # libopus reads writable buffers, like a copy-on-write memory map, in place, the others are copied
+            pcm = bytes(pcm) if pcm.readonly else (c_char * size).from_buffer(pcm)
         self._encoder_ready.acquire(blocking=True)
+        start = perf_counter()
         try:
-            encoded = self._encoder.encode(pcm, len(pcm) // self._sample_size)
+            encoded = opus_encode(self._encoder.encoder_state, pcm, size // self._sample_size, size)
         except OpusError:
             encoded = b''
+        self._encode_time += perf_counter() - start
+        self._frames += 1
+        self._bytes += len(encoded)
         self._encoder_ready.release()
         return encoded
 
+    def reset(self):
+        """Drop the encoder state, so the next transmission does not start from the tail of the previous one"""
+        with self._encoder_ready:
+            self._encoder.reset_state()
+
+    @property
+    def dtx(self):
+        return self._dtx
+
+    @dtx.setter
+    def dtx(self, dtx: bool):
+        self._dtx = dtx
+        with self._encoder_ready:
+            self._apply_settings()
+
     @property
     def sample_size(self):
         return self._sample_size
@@ -61,6 +196,12 @@ class Encoder:
         return self._samples
 
     def _calc_bitrate(self):
+        bitrate = self._calc_max_bitrate()
+        if self._target_bitrate is not None:
+            return min(self._target_bitrate, bitrate)
+        return bitrate
+
+    def _calc_max_bitrate(self):
         overhead_per_packet = 20
         # FIXME(nico9889): ??? self._audio_per_packet == self.encoder_framesize, results 1
         overhead_per_packet += (3 * int(self._audio_per_packet) / self.encoder_framesize)
@@ -72,6 +213,21 @@ class Encoder:
         overhead_per_second = int(overhead_per_packet * 8 / self._audio_per_packet)
         return self._bandwidth - overhead_per_second
 
+    @property
+    def max_bitrate(self):
+        """Highest bitrate allowed by the bandwidth, once the packets overhead is accounted for"""
+        return self._calc_max_bitrate()
+
+    @property
+    def target_bitrate(self) -> int | None:
+        """Bitrate to use when lower than the one allowed by the bandwidth, None to always use the latter"""
+        return self._target_bitrate
+
+    @target_bitrate.setter
+    def target_bitrate(self, bitrate: int | None):
+        self._target_bitrate = bitrate
+        self._encoder.bitrate = self._calc_bitrate()
+
     @property
     def bandwidth(self):
         return self._bandwidth
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from pymumble_typed.mumble import Mumble
+    from pymumble_typed.sound.audio import OpusPacket
+    from pymumble_typed.users import User
+
+from math import log10
+from threading import Lock
+from time import monotonic
+
+import numpy as np
+
+from pymumble_typed.network.ping import RepeatTimer
+from pymumble_typed.sound import SAMPLE_RATE
+from pymumble_typed.sound.decoder import Decoder
+
+# Samples at or above this fraction of full scale are counted as clipped
+CLIP_THRESHOLD = 0.999
+SILENCE_DB = -120.
+
+
+def to_db(level: float) -> float:
+    return 20 * log10(level) if level > 0 else SILENCE_DB
+
+
+class Level:
+    """Loudness of a speaker over a metering window, levels are relative to the int16 full scale"""
+
+    __slots__ = ("clipped", "peak", "rms", "samples", "session", "timestamp")
+
+    def __init__(self, session: int, rms: float, peak: float, clipped: int, samples: int, timestamp: float):
+        self.session = session
+        self.rms = rms
+        self.peak = peak
+        self.clipped = clipped
+        self.samples = samples
+        self.timestamp = timestamp
+
+    @property
+    def rms_db(self) -> float:
+        return to_db(self.rms)
+
+    @property
+    def peak_db(self) -> float:
+        return to_db(self.peak)
+
+    @property
+    def clipping(self) -> bool:
+        return self.clipped > 0
+
+    def __repr__(self):
+        return (f"Level(session={self.session}, rms_db={self.rms_db:.1f}, peak_db={self.peak_db:.1f}, "
+                f"clipped={self.clipped})")
+
+
+class _Channel:
+    def __init__(self):
+        self.decoder = Decoder(SAMPLE_RATE, 1)
+        self.packets: list[OpusPacket] = []
+        self.last_packet = 0.
+
+
+class LoudnessMeter:
+    """
+    Measure the RMS and peak level of every speaker over fixed windows.
+
+    Packets are only buffered on the receiving thread. Once per window they are decoded and the levels of all the
+    speakers are computed together with a few numpy reductions over the concatenated PCM. Results are available
+    through `levels()` and, every `callback_interval` seconds, through `on_levels`.
+    """
+
+    def __init__(self, mumble: Mumble, window: float = 0.5, on_levels: Callable[[dict[int, Level]], None] | None = None,
+                 callback_interval: float = 1., idle_timeout: float = 2., enabled: bool = True):
+        self._mumble = mumble
+        self._window = window
+        self._on_levels = on_levels
+        self._callback_interval = callback_interval
+        self._idle_timeout = idle_timeout
+        self._channels: dict[int, _Channel] = {}
+        self._levels: dict[int, Level] = {}
+        self._last_callback = 0.
+        self._lock = Lock()
+        self._timer: RepeatTimer | None = None
+        self._logger = mumble.logger.getChild(self.__class__.__name__)
+        if enabled:
+            self.enable()
+
+    @property
+    def enabled(self) -> bool:
+        return self._timer is not None
+
+    def enable(self):
+        if self._timer is not None:
+            return
+        self._timer = RepeatTimer(self._window, self._measure)
+        self._timer.start()
+        self._mumble.add_sound_sink(self.push)
+
+    def disable(self):
+        if self._timer is None:
+            return
+        self._mumble.remove_sound_sink(self.push)
+        self._timer.cancel()
+        self._timer = None
+        with self._lock:
+            self._channels.clear()
+            self._levels = {}
+
+    def push(self, user: User, packet: OpusPacket):
+        with self._lock:
+            try:
+                channel = self._channels[user.session]
+            except KeyError:
+                channel = self._channels[user.session] = _Channel()
+            channel.packets.append(packet)
+            channel.last_packet = packet.timestamp
+
+    def _measure(self):
+        now = monotonic()
+        with self._lock:
+            pending: list[tuple[int, _Channel, list[OpusPacket]]] = []
+            for session, channel in list(self._channels.items()):
+                if channel.packets:
+                    pending.append((session, channel, channel.packets))
+                    channel.packets = []
+                elif now - channel.last_packet > self._idle_timeout:
+                    del self._channels[session]
+        levels = {session: level for session, level in self._levels.items()
+                  if session in self._channels and now - level.timestamp <= self._idle_timeout}
+
+        sessions: list[int] = []
+        chunks: list[bytes] = []
+        for session, channel, packets in pending:
+            pcm = b"".join(channel.decoder.decode(packet.data)
+                           for packet in sorted(packets, key=lambda p: p.frame_number))
+            if pcm:
+                sessions.append(session)
+                chunks.append(pcm)
+        if sessions:
+            sizes = np.fromiter((len(chunk) // 2 for chunk in chunks), dtype=np.intp, count=len(chunks))
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            pcm = np.frombuffer(b"".join(chunks), dtype=np.int16).astype(np.float32) * (1 / 32768)
+            magnitude = np.abs(pcm)
+            rms = np.sqrt(np.add.reduceat(pcm * pcm, starts) / sizes)
+            peak = np.maximum.reduceat(magnitude, starts)
+            clipped = np.add.reduceat(magnitude >= CLIP_THRESHOLD, starts)
+            for i, session in enumerate(sessions):
+                levels[session] = Level(session, float(rms[i]), float(peak[i]), int(clipped[i]), int(sizes[i]), now)
+        self._levels = levels
+
+        if self._on_levels and now - self._last_callback >= self._callback_interval:
+            self._last_callback = now
+            try:
+                self._on_levels(dict(levels))
+            except Exception:
+                self._logger.error("Error while executing levels callback", exc_info=True)
+
+    def levels(self) -> dict[int, Level]:
+        return dict(self._levels)
+
+    def level(self, session: int) -> Level | None:
+        return self._levels.get(session)
+
+    def close(self):
+        self.disable()
@@ -0,0 +1,374 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from pymumble_typed.mumble import Mumble
+    from pymumble_typed.sound.audio import OpusPacket
+    from pymumble_typed.users import User
+
+from contextlib import suppress
+from heapq import heappop, heappush
+from itertools import count
+from queue import Empty, Full, Queue
+from threading import Condition, Event, Lock, Thread
+from time import monotonic
+
+import numpy as np
+
+from pymumble_typed.sound import AUDIO_PER_PACKET, CHANNELS, SAMPLE_RATE, SEQUENCE_DURATION
+from pymumble_typed.sound.convert import PCMConverter
+from pymumble_typed.sound.decoder import Decoder
+
+SAMPLES_PER_SEQUENCE = int(SEQUENCE_DURATION * SAMPLE_RATE)
+# Missing packets longer than this are not concealed, the speaker is considered to have paused
+MAX_CONCEALED_SEQUENCES = 10
+NEVER_PLAYED = 1 << 30
+
+
+def soft_clip(mix: np.ndarray, knee: float = 0.8) -> np.ndarray:
+    """Convert a float mix in the int16 range to int16, compressing only the samples above the knee"""
+    normalized = mix * (1 / 32768)
+    magnitude = np.abs(normalized)
+    over = magnitude > knee
+    if over.any():
+        compressed = knee + (1 - knee) * np.tanh((magnitude[over] - knee) / (1 - knee))
+        normalized[over] = np.copysign(compressed, normalized[over])
+    return np.clip(np.rint(normalized * 32768), -32768, 32767).astype(np.int16)
+
+
+class _Speaker:
+    # The queue and its counters are shared with push and guarded by the mixer lock, the decoding state is only used
+    # by the mixer thread
+    def __init__(self, decoder: Decoder, channels: int):
+        self.decoder = decoder
+        self.channels = channels
+        self.queue: list[tuple[int, int, OpusPacket]] = []
+        self.pcm = np.empty(0, dtype=np.int16)
+        self.playing = False
+        self.next_sequence: int | None = None
+        self.first_packet = 0.
+        self.last_packet = 0.
+        # Samples per channel waiting in the queue, as declared by the packets TOC
+        self.queued = 0
+        self.gain = 1.
+
+    def _decode(self, packet: OpusPacket) -> np.ndarray:
+        pcm = self.decoder.decode(packet.data)
+        if self.next_sequence is not None:
+            missing = packet.frame_number - self.next_sequence
+            if 0 < missing <= MAX_CONCEALED_SEQUENCES:
+                pcm = self.decoder.conceal(missing * SAMPLES_PER_SEQUENCE) + pcm
+        self.gain = packet.volume_adjustment
+        self.next_sequence = packet.frame_number + packet.toc.samples // SAMPLES_PER_SEQUENCE
+        return np.frombuffer(pcm, dtype=np.int16)
+
+    def take(self, size: int) -> list[OpusPacket] | None:
+        """Packets to decode for the next `size` samples, None when there is nothing to play"""
+        packets = []
+        available = len(self.pcm)
+        expected = self.next_sequence
+        while available < size and self.queue:
+            _, __, packet = heappop(self.queue)
+            self.queued -= packet.toc.samples
+            if expected is not None and packet.frame_number < expected:
+                continue
+            packets.append(packet)
+            available += packet.toc.samples * self.channels
+            expected = packet.frame_number + packet.toc.samples // SAMPLES_PER_SEQUENCE
+        return packets if available else None
+
+    def pull(self, packets: list[OpusPacket], size: int) -> np.ndarray:
+        """Decode the packets returned by take and return the next `size` samples"""
+        chunks = [self.pcm, *(self._decode(packet) for packet in packets)]
+        available = sum(len(chunk) for chunk in chunks)
+        pcm = np.concatenate(chunks) if len(chunks) > 1 else self.pcm
+        if available < size:
+            pcm = np.pad(pcm, (0, size - available))
+        self.pcm = pcm[size:]
+        return pcm[:size]
+
+
+class ReceiveMixer:
+    """Mix the audio received from every active speaker into a single PCM stream, on a shared timeline"""
+
+    def __init__(self, mumble: Mumble, on_frame: Callable[[bytes], None] | None = None, channels: int = CHANNELS,
+                 frame_duration: float = AUDIO_PER_PACKET, jitter: float = 0.06, idle_timeout: float = 0.5,
+                 channel_id: int | None = None, emit_silence: bool = True, buffer: float = 1.):
+        self._mumble = mumble
+        self._on_frame = on_frame
+        self._channels = channels
+        self._frame_duration = frame_duration
+        self._frame_size = int(frame_duration * SAMPLE_RATE) * channels
+        self._jitter = jitter
+        self._jitter_samples = int(jitter * SAMPLE_RATE)
+        self._idle_timeout = idle_timeout
+        self._channel_id = channel_id
+        self._emit_silence = emit_silence
+        self._speakers: dict[int, _Speaker] = {}
+        self._order = count()
+        self._lock = Lock()
+        self._frames: Queue[bytes] = Queue(maxsize=max(1, int(buffer / frame_duration)))
+        self._exit = Event()
+        self._logger = mumble.logger.getChild(self.__class__.__name__)
+        self._thread = Thread(target=self._loop, name="ReceiveMixer:Loop", daemon=True)
+        self._thread.start()
+        mumble.add_sound_sink(self.push)
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def active_speakers(self) -> list[int]:
+        with self._lock:
+            return [session for session, speaker in self._speakers.items() if speaker.playing]
+
+    def push(self, user: User, packet: OpusPacket):
+        if self._channel_id is not None and user.channel_id != self._channel_id:
+            return
+        now = packet.timestamp
+        with self._lock:
+            try:
+                speaker = self._speakers[user.session]
+            except KeyError:
+                speaker = self._speakers[user.session] = _Speaker(Decoder(SAMPLE_RATE, self._channels), self._channels)
+            if not speaker.queue and not speaker.playing:
+                speaker.first_packet = now
+            speaker.last_packet = now
+            speaker.queued += packet.toc.samples
+            heappush(speaker.queue, (packet.frame_number, next(self._order), packet))
+
+    def _mix(self) -> np.ndarray | None:
+        now = monotonic()
+        taken: list[tuple[_Speaker, list[OpusPacket]]] = []
+        with self._lock:
+            for session, speaker in list(self._speakers.items()):
+                if not speaker.playing:
+                    # Start playing once enough audio is buffered to absorb the jitter, or it waited long enough
+                    buffered = speaker.queued >= self._jitter_samples or now - speaker.first_packet >= self._jitter
+                    if not speaker.queue or not buffered:
+                        if now - speaker.last_packet > self._idle_timeout:
+                            del self._speakers[session]
+                        continue
+                    speaker.playing = True
+                packets = speaker.take(self._frame_size)
+                if packets is None:
+                    speaker.playing = False
+                    speaker.next_sequence = None
+                    continue
+                taken.append((speaker, packets))
+        # Decoding is done out of the lock, so that push is not blocked for the whole mix
+        frames = [speaker.pull(packets, self._frame_size) for speaker, packets in taken]
+        gains = [speaker.gain for speaker, _ in taken]
+        if not frames:
+            return None
+        if len(frames) == 1 and gains[0] == 1.:
+            return frames[0]
+        # A single matrix product applies the gains and sums the speakers
+        mix = np.asarray(gains, dtype=np.float32) @ np.stack(frames).astype(np.float32)
+        return soft_clip(mix)
+
+    def _publish(self, frame: bytes):
+        if self._on_frame:
+            try:
+                self._on_frame(frame)
+            except Exception:
+                self._logger.error("Error while executing mixer callback", exc_info=True)
+        while True:
+            try:
+                self._frames.put(frame, block=False)
+                return
+            except Full:
+                # Nobody is pulling: drop the oldest frame, the newest audio is always the most relevant
+                with suppress(Empty):
+                    self._frames.get(block=False)
+
+    def _loop(self):
+        next_tick = monotonic()
+        while not self._exit.is_set():
+            mix = self._mix()
+            if mix is not None:
+                self._publish(mix.tobytes())
+            elif self._emit_silence:
+                self._publish(bytes(self._frame_size * 2))
+            next_tick += self._frame_duration
+            delay = next_tick - monotonic()
+            if delay > 0:
+                self._exit.wait(delay)
+            elif delay < -self._frame_duration * 5:
+                self._logger.warning(f"mixer is late by {-delay:.3f}s, skipping ahead")
+                next_tick = monotonic()
+
+    def read(self, timeout: float | None = None) -> bytes | None:
+        try:
+            return self._frames.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def close(self):
+        self._mumble.remove_sound_sink(self.push)
+        self._exit.set()
+        self._thread.join()
+
+
+class _Source:
+    def __init__(self, name: str, converter: PCMConverter, gain: float, priority: int):
+        self.name = name
+        self.converter = converter
+        self.gain = gain
+        self.priority = priority
+        self.pcm = bytearray()
+        # Serializes the use of the converter, held before the lock of the mixer
+        self.lock = Lock()
+        # Gain applied by the ducking at the end of the last frame, and frames since the source last had audio
+        self.duck = 1.
+        self.idle_frames = NEVER_PLAYED
+
+
+class SendMixer:
+    """
+    Mix several named sources into the voice output, encoding a single frame no matter how many sources are playing.
+
+    Every source has a gain and a priority: while a source is playing, the ones with a lower priority are ducked to
+    `duck_gain`, fading in `attack` seconds and back in `release` seconds once it stopped for `hold` seconds.
+    `write` blocks while a source has more than `buffer` seconds queued, so producers can write as fast as they can.
+    Mixed frames are kept `latency` seconds ahead of the sender, changes of gain are heard within that delay.
+    """
+
+    def __init__(self, mumble: Mumble, duck_gain: float = 0.25, attack: float = 0.05, release: float = 0.5,
+                 hold: float = 0.3, buffer: float = 1., latency: float = 0.06):
+        self._mumble = mumble
+        self._duck_gain = duck_gain
+        self._attack = attack
+        self._release = release
+        self._hold = hold
+        self._buffer = buffer
+        self._latency = latency
+        self._sources: dict[str, _Source] = {}
+        self._condition = Condition(Lock())
+        self._exit = Event()
+        self._logger = mumble.logger.getChild(self.__class__.__name__)
+        self._thread = Thread(target=self._loop, name="SendMixer:Loop", daemon=True)
+        self._thread.start()
+
+    def add_source(self, name: str, gain: float = 1., priority: int = 0, sample_rate: int = SAMPLE_RATE,
+                   channels: int = 1, dtype: np.dtype | str = np.int16):
+        """Register a source whose audio is written in the given format"""
+        encoder = self._mumble.voice.encoder
+        converter = PCMConverter(sample_rate, channels, dtype, encoder.sample_rate, encoder.channels)
+        with self._condition:
+            if name in self._sources:
+                raise ValueError(f"Source {name} already exists")
+            self._sources[name] = _Source(name, converter, gain, priority)
+
+    def remove_source(self, name: str):
+        with self._condition:
+            self._sources.pop(name, None)
+            self._condition.notify_all()
+
+    def set_gain(self, name: str, gain: float):
+        with self._condition:
+            self._sources[name].gain = gain
+
+    def set_priority(self, name: str, priority: int):
+        with self._condition:
+            self._sources[name].priority = priority
+
+    def clear(self, name: str):
+        """Drop the audio queued by a source, as when skipping a track"""
+        source = self._sources[name]
+        with source.lock, self._condition:
+            source.pcm.clear()
+            source.converter.reset()
+            self._condition.notify_all()
+
+    def queued(self, name: str) -> float:
+        encoder = self._mumble.voice.encoder
+        return len(self._sources[name].pcm) / (encoder.sample_rate * encoder.channels * 2)
+
+    def write(self, name: str, data: np.ndarray | bytes | bytearray | memoryview, end: bool = False):
+        """Queue audio for a source, `end` flushes the converter once the stream of the source is over"""
+        source = self._sources[name]
+        encoder = self._mumble.voice.encoder
+        limit = int(self._buffer * encoder.sample_rate) * encoder.channels * 2
+        with self._condition:
+            while len(source.pcm) > limit and self._sources.get(name) is source and not self._exit.is_set():
+                self._condition.wait()
+        # Converted and queued under the lock of the source, so that clear() cannot reset the converter meanwhile
+        with source.lock:
+            converter = source.converter
+            if converter.dst_sample_rate != encoder.sample_rate or converter.dst_channels != encoder.channels:
+                converter = source.converter = PCMConverter(converter.sample_rate, converter.channels,
+                                                            converter.dtype, encoder.sample_rate, encoder.channels)
+            pcm = converter.process(data)
+            if end:
+                pcm += converter.flush()
+            with self._condition:
+                source.pcm += pcm
+                self._condition.notify_all()
+
+    def _mix(self) -> np.ndarray | None:
+        encoder = self._mumble.voice.encoder
+        frame_duration = encoder.audio_per_packet
+        frames = int(frame_duration * encoder.sample_rate)
+        size = frames * encoder.channels * 2
+        hold = int(self._hold / frame_duration)
+        chunks: list[np.ndarray] = []
+        ramps: list[np.ndarray] = []
+        with self._condition:
+            sources = list(self._sources.values())
+            for source in sources:
+                source.idle_frames = 0 if source.pcm else source.idle_frames + 1
+            playing = [source.priority for source in sources if source.idle_frames <= hold]
+            top = max(playing, default=0)
+            for source in sources:
+                target = self._duck_gain if source.priority < top else 1.
+                fade = self._attack if target < source.duck else self._release
+                step = frame_duration / fade if fade > 0 else 1.
+                duck = max(target, source.duck - step) if target < source.duck else min(target, source.duck + step)
+                start, source.duck = source.duck, duck
+                if not source.pcm:
+                    continue
+                pcm = np.frombuffer(bytes(source.pcm[:size]), dtype=np.int16)
+                del source.pcm[:size]
+                if len(pcm) < frames * encoder.channels:
+                    pcm = np.pad(pcm, (0, frames * encoder.channels - len(pcm)))
+                chunks.append(pcm.reshape(frames, encoder.channels))
+                # The ducking gain moves linearly along the frame, stepping it would be audible
+                ramps.append(np.linspace(start, duck, frames, endpoint=False, dtype=np.float32) * source.gain)
+            if chunks:
+                self._condition.notify_all()
+        if not chunks:
+            return None
+        if len(chunks) == 1 and not (ramps[0] != 1.).any():
+            return chunks[0].reshape(-1)
+        mix = np.einsum("sf,sfc->fc", np.stack(ramps), np.stack(chunks).astype(np.float32))
+        return soft_clip(mix.reshape(-1))
+
+    def _loop(self):
+        while not self._exit.is_set():
+            voice = self._mumble.voice
+            frame_duration = voice.encoder.audio_per_packet
+            if voice.buffered >= self._latency:
+                # The sender drains the output in real time, mixing only when it runs low paces the mixer
+                self._exit.wait(frame_duration / 2)
+                continue
+            frame = self._mix()
+            if frame is None:
+                with self._condition:
+                    self._condition.wait(frame_duration)
+                continue
+            try:
+                voice.add_pcm(frame.tobytes())
+            except RuntimeError:
+                self._logger.debug("client is not connected, dropping mixed frame")
+                self._exit.wait(frame_duration)
+
+    def close(self):
+        self._exit.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._thread.join()
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from pymumble_typed.mumble import Mumble
+    from pymumble_typed.sound.audio import OpusPacket
+    from pymumble_typed.users import User
+
+from os import path as os_path
+from random import getrandbits
+from struct import pack, pack_into
+from threading import Lock
+from time import time
+from zlib import crc32
+
+from pymumble_typed.constants import VERSION
+from pymumble_typed.network.ping import RepeatTimer
+from pymumble_typed.sound import AUDIO_PER_PACKET, CHANNELS, SAMPLE_RATE, SEQUENCE_DURATION
+
+# Ogg uses the non-reflected CRC-32 (poly 0x04C11DB7, no init, no final xor), while zlib implements the reflected one.
+# Reflecting every input byte and the final result lets zlib do the heavy lifting in C.
+_REVERSED_BITS = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+# CELT-only fullband frames with the silence flag set, decoders output digital silence for them
+SILENCE_20MS = b"\xf8\xff\xfe"
+SILENCE_10MS = b"\xf0\xff\xfe"
+
+SAMPLES_PER_SEQUENCE = int(SEQUENCE_DURATION * SAMPLE_RATE)
+# Packets arriving this many sequences behind the stream are considered late duplicates, not a sequence restart
+LATE_TOLERANCE = 50
+
+
+def ogg_crc(data: bytes | bytearray) -> int:
+    crc = crc32(data.translate(_REVERSED_BITS), 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return int(f"{crc:032b}"[::-1], 2)
+
+
+class OggOpusWriter:
+    BOS = 0x02
+    EOS = 0x04
+    MAX_SEGMENTS = 255
+
+    def __init__(self, file_path: str, channels: int = CHANNELS, comments: list[str] | None = None):
+        self._file = open(file_path, "wb", buffering=0)  # noqa: SIM115
+        self._serial = getrandbits(32)
+        self._page_sequence = 0
+        self._granule = 0
+        self._lock = Lock()
+        self._pending: list[tuple[bytes, int]] = []
+        self._buffer = bytearray()
+        self.closed = False
+
+        head = b"OpusHead" + pack("<BBHIhB", 1, channels, 0, SAMPLE_RATE, 0, 0)
+        vendor = f"pymumble-typed {'.'.join(map(str, VERSION))}".encode()
+        tags = b"OpusTags" + pack("<I", len(vendor)) + vendor
+        comments = [comment.encode() for comment in comments or []]
+        tags += pack("<I", len(comments))
+        for comment in comments:
+            tags += pack("<I", len(comment)) + comment
+        self._buffer += self._page([head], 0, self.BOS)
+        self._buffer += self._page([tags], 0, 0)
+
+    @property
+    def granule(self) -> int:
+        return self._granule
+
+    def write(self, data: bytes, samples: int):
+        with self._lock:
+            self._granule += samples
+            self._pending.append((data, self._granule))
+
+    def write_silence(self, samples: int):
+        frames, remainder = divmod(samples, SAMPLES_PER_SEQUENCE * 2)
+        with self._lock:
+            for _ in range(frames):
+                self._granule += SAMPLES_PER_SEQUENCE * 2
+                self._pending.append((SILENCE_20MS, self._granule))
+            if remainder >= SAMPLES_PER_SEQUENCE:
+                self._granule += SAMPLES_PER_SEQUENCE
+                self._pending.append((SILENCE_10MS, self._granule))
+
+    def _page(self, packets: list[bytes], granule: int, flags: int) -> bytearray:
+        lacing = bytearray()
+        for packet in packets:
+            lacing += b"\xff" * (len(packet) // 255)
+            lacing.append(len(packet) % 255)
+        page = bytearray(pack("<4sBBqIIIB", b"OggS", 0, flags, granule, self._serial, self._page_sequence, 0,
+                              len(lacing)))
+        page += lacing
+        for packet in packets:
+            page += packet
+        pack_into("<I", page, 22, ogg_crc(page))
+        self._page_sequence += 1
+        return page
+
+    def _paginate(self, pending: list[tuple[bytes, int]], last: bool):
+        packets: list[bytes] = []
+        granule = self._granule
+        segments = 0
+        for data, end in pending:
+            needed = len(data) // 255 + 1
+            if packets and segments + needed > self.MAX_SEGMENTS:
+                self._buffer += self._page(packets, granule, 0)
+                packets = []
+                segments = 0
+            packets.append(data)
+            granule = end
+            segments += needed
+        if packets or last:
+            self._buffer += self._page(packets, granule, self.EOS if last else 0)
+
+    def flush(self, last: bool = False):
+        with self._lock:
+            if self.closed:
+                return
+            pending, self._pending = self._pending, []
+            self._paginate(pending, last)
+            buffer, self._buffer = self._buffer, bytearray()
+            if last:
+                self.closed = True
+        if buffer:
+            self._file.write(buffer)
+
+    def close(self):
+        self.flush(last=True)
+        self._file.close()
+
+
+class _Track:
+    def __init__(self, writer: OggOpusWriter):
+        self.writer = writer
+        self.next_sequence: int | None = None
+        self.last_received = 0.
+        self.last_samples = 0
+
+
+class OggOpusRecorder:
+    """Record the received Opus stream of every user in a separate Ogg Opus file, without decoding it"""
+
+    def __init__(self, mumble: Mumble, directory: str, flush_interval: float = 1., channels: int = CHANNELS,
+                 path_factory: Callable[[User], str] | None = None):
+        self._mumble = mumble
+        self._directory = directory
+        self._channels = channels
+        self._path_factory = path_factory or self._default_path
+        self._tracks: dict[int, _Track] = {}
+        self._lock = Lock()
+        self._logger = mumble.logger.getChild(self.__class__.__name__)
+        self._timer = RepeatTimer(flush_interval, self.flush)
+        self._timer.start()
+        mumble.add_sound_sink(self.push)
+
+    def _default_path(self, user: User) -> str:
+        return os_path.join(self._directory, f"{user.session}_{int(time())}.opus")
+
+    def _track(self, user: User) -> _Track:
+        try:
+            return self._tracks[user.session]
+        except KeyError:
+            with self._lock:
+                writer = OggOpusWriter(self._path_factory(user), self._channels, [f"TITLE={user.name}"])
+                track = self._tracks[user.session] = _Track(writer)
+            self._logger.debug(f"started recording session {user.session}")
+            return track
+
+    def push(self, user: User, packet: OpusPacket):
+        now = packet.timestamp
+        track = self._track(user)
+        samples = packet.toc.samples or int(AUDIO_PER_PACKET * SAMPLE_RATE)
+        if track.next_sequence is not None:
+            gap = packet.frame_number - track.next_sequence
+            if -LATE_TOLERANCE < gap < 0:
+                return
+            if gap < 0:
+                # The sender restarted its sequence after a pause, fall back to the wall clock to measure it
+                elapsed = now - track.last_received - track.last_samples / SAMPLE_RATE
+                gap = max(0, round(elapsed / SEQUENCE_DURATION))
+            if gap:
+                track.writer.write_silence(gap * SAMPLES_PER_SEQUENCE)
+        track.writer.write(packet.data, samples)
+        track.next_sequence = packet.frame_number + samples // SAMPLES_PER_SEQUENCE
+        track.last_received = now
+        track.last_samples = samples
+
+    def flush(self):
+        for track in list(self._tracks.values()):
+            try:
+                track.writer.flush()
+            except OSError:
+                self._logger.error("failed to flush recording", exc_info=True)
+
+    def close_session(self, session: int):
+        with self._lock:
+            track = self._tracks.pop(session, None)
+        if track:
+            track.writer.close()
+
+    def close(self):
+        self._mumble.remove_sound_sink(self.push)
+        self._timer.cancel()
+        for session in list(self._tracks):
+            self.close_session(session)
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from math import ceil, gcd
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Taps of every polyphase branch, per unit of decimation
+TAPS_PER_PHASE = 16
+KAISER_BETA = 8.6
+ROLLOFF = 0.92
+
+
+class Resampler:
+    """
+    Stateful polyphase resampler for interleaved audio.
+
+    The input is conceptually upsampled by `up`, low-pass filtered and decimated by `down`, but only the filter
+    branch needed by each output sample is evaluated. The tail of every chunk is kept, so a stream can be fed in
+    chunks of any size without discontinuities at their boundaries.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int, channels: int = 1):
+        divisor = gcd(src_rate, dst_rate)
+        self._up = dst_rate // divisor
+        self._down = src_rate // divisor
+        self._channels = channels
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+
+        taps = TAPS_PER_PHASE * ceil(self._down / self._up)
+        length = taps * self._up
+        cutoff = ROLLOFF * 0.5 / max(self._up, self._down)
+        # Centering the filter on a whole sample keeps its delay an integer number of upsampled samples
+        center = (length - 1) // 2
+        window = np.zeros(length)
+        window[:center * 2 + 1] = np.kaiser(center * 2 + 1, KAISER_BETA)
+        n = np.arange(length) - center
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * window * self._up
+        # Every row is a polyphase branch, reversed so it can be applied as a dot product over a sliding window
+        self._phases = prototype.reshape(taps, self._up).T[:, ::-1].astype(np.float32)
+        self._taps = taps
+        self._delay = center
+        self.reset()
+
+    @property
+    def passthrough(self) -> bool:
+        return self._up == self._down
+
+    def reset(self):
+        self._history = np.zeros((self._taps - 1, self._channels), dtype=np.float32)
+        # Upsampled position of the next output sample, relative to the first sample of the next chunk.
+        # Starting at the filter delay keeps the output aligned with the input.
+        self._position = self._delay
+
+    def process(self, pcm: np.ndarray) -> np.ndarray:
+        """Resample float or integer samples, shaped (frames,) or (frames, channels), returning float32"""
+        pcm = pcm.reshape(-1, self._channels).astype(np.float32, copy=False)
+        if self.passthrough:
+            return pcm.copy()
+        frames = len(pcm)
+        available = frames * self._up - self._position
+        if available <= 0:
+            self._position -= frames * self._up
+            self._history = np.concatenate((self._history, pcm))[-(self._taps - 1):]
+            return np.empty((0, self._channels), dtype=np.float32)
+
+        count = ceil(available / self._down)
+        positions = self._position + np.arange(count) * self._down
+        indexes, phases = np.divmod(positions, self._up)
+        buffer = np.concatenate((self._history, pcm))
+        # windows[i] holds the `taps` input samples ending at input sample i, shaped (channels, taps)
+        windows = sliding_window_view(buffer, self._taps, axis=0)
+        resampled = np.einsum("nct,nt->nc", windows[indexes], self._phases[phases])
+
+        self._position = int(positions[-1]) + self._down - frames * self._up
+        self._history = buffer[-(self._taps - 1):]
+        return resampled
+
+    def flush(self) -> np.ndarray:
+        """Push the samples still held back by the filter delay out of the resampler"""
+        if self.passthrough:
+            return np.empty((0, self._channels), dtype=np.float32)
+        padding = ceil((self._delay + self._down) / self._up) + 1
+        return self.process(np.zeros((padding, self._channels), dtype=np.float32))
+
+
+def to_int16(pcm: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(pcm), -32768, 32767).astype(np.int16)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from pymumble_typed.mumble import Mumble
+    from pymumble_typed.sound.audio import OpusPacket
+    from pymumble_typed.users import User
+
+from enum import StrEnum
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+from time import monotonic
+
+import numpy as np
+
+from pymumble_typed.network.ping import RepeatTimer
+from pymumble_typed.sound import SAMPLE_RATE
+from pymumble_typed.sound.decoder import Decoder
+from pymumble_typed.sound.resample import Resampler, to_int16
+
+
+class UtteranceEnd(StrEnum):
+    Terminator = "terminator"
+    Silence = "silence"
+    MaxLength = "max_length"
+    Closed = "closed"
+
+
+class Utterance:
+    def __init__(self, user: User, packets: list[OpusPacket], start: float, end: float, reason: UtteranceEnd):
+        self.user = user
+        self.session = user.session
+        self.packets = packets
+        self.start = start
+        self.end = end
+        self.reason = reason
+        self.pcm: np.ndarray | None = None
+        self.sample_rate: int | None = None
+
+    @property
+    def frames(self) -> list[bytes]:
+        return [packet.data for packet in self.packets]
+
+    @property
+    def duration(self) -> float:
+        return sum(packet.toc.duration for packet in self.packets)
+
+
+class _Segment:
+    def __init__(self, user: User, now: float):
+        self.user = user
+        self.packets: list[OpusPacket] = []
+        self.start = now
+        self.last_packet = now
+        self.duration = 0.
+
+
+class UtteranceSegmenter:
+    """
+    Group the packets received from every user into utterances, handing each one over once it is complete.
+
+    An utterance ends on a terminator packet, after `silence_timeout` seconds without packets or once it is
+    `max_length` seconds long. When `decode` is set, the utterance is decoded and resampled to `sample_rate` in a
+    worker thread before being passed to the callback.
+    """
+
+    def __init__(self, mumble: Mumble, on_utterance: Callable[[Utterance], None], silence_timeout: float = 0.5,
+                 max_length: float = 30., decode: bool = True, sample_rate: int = 16000, channels: int = 1,
+                 workers: int = 1):
+        self._mumble = mumble
+        self._on_utterance = on_utterance
+        self._silence_timeout = silence_timeout
+        self._max_length = max_length
+        self._decode = decode
+        self._sample_rate = sample_rate
+        self._channels = channels
+        self._segments: dict[int, _Segment] = {}
+        self._lock = Lock()
+        self._logger = mumble.logger.getChild(self.__class__.__name__)
+        self._pool = ThreadPool(workers)
+        self._timer = RepeatTimer(min(silence_timeout / 2, 0.1), self._sweep)
+        self._timer.start()
+        mumble.add_sound_sink(self.push)
+
+    def push(self, user: User, packet: OpusPacket):
+        now = packet.timestamp
+        with self._lock:
+            try:
+                segment = self._segments[user.session]
+            except KeyError:
+                segment = self._segments[user.session] = _Segment(user, now)
+            segment.packets.append(packet)
+            segment.last_packet = now
+            segment.duration += packet.toc.duration
+            if packet.is_terminator:
+                reason = UtteranceEnd.Terminator
+            elif segment.duration >= self._max_length:
+                reason = UtteranceEnd.MaxLength
+            else:
+                return
+            del self._segments[user.session]
+        self._close(segment, reason)
+
+    def _sweep(self):
+        now = monotonic()
+        with self._lock:
+            expired = [session for session, segment in self._segments.items()
+                       if now - segment.last_packet >= self._silence_timeout]
+            segments = [self._segments.pop(session) for session in expired]
+        for segment in segments:
+            self._close(segment, UtteranceEnd.Silence)
+
+    def _close(self, segment: _Segment, reason: UtteranceEnd):
+        utterance = Utterance(segment.user, segment.packets, segment.start, segment.last_packet, reason)
+        self._pool.apply_async(self._emit, (utterance,))
+
+    def _pcm(self, utterance: Utterance) -> np.ndarray:
+        decoder = Decoder(SAMPLE_RATE, self._channels)
+        pcm = np.frombuffer(b"".join(decoder.decode(packet.data) for packet in
+                                     sorted(utterance.packets, key=lambda p: p.frame_number)), dtype=np.int16)
+        if self._sample_rate == SAMPLE_RATE:
+            return pcm
+        resampler = Resampler(SAMPLE_RATE, self._sample_rate, self._channels)
+        resampled = np.concatenate((resampler.process(pcm), resampler.flush()))
+        frames = len(pcm) // self._channels * self._sample_rate // SAMPLE_RATE
+        return to_int16(resampled[:frames]).reshape(-1)
+
+    def _emit(self, utterance: Utterance):
+        try:
+            if self._decode:
+                utterance.pcm = self._pcm(utterance)
+                utterance.sample_rate = self._sample_rate
+            self._on_utterance(utterance)
+        except Exception:
+            self._logger.error("Error while processing utterance", exc_info=True)
+
+    def close(self):
+        self._mumble.remove_sound_sink(self.push)
+        self._timer.cancel()
+        with self._lock:
+            segments, self._segments = list(self._segments.values()), {}
+        for segment in segments:
+            self._close(segment, UtteranceEnd.Closed)
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from logging import Logger
+
+    from pymumble_typed.sound.voice import VoiceOutput
+
+from threading import Event, Lock, Thread
+from time import monotonic
+
+
+class PacedSender:
+    """
+    Single thread encoding and sending the frames queued in every registered output, each at its own pace.
+
+    Outputs only enqueue frames, so producers are never blocked by the transmission itself: they are throttled by the
+    fill level of the output buffer instead.
+    """
+
+    def __init__(self, logger: Logger):
+        self._outputs: list[VoiceOutput] = []
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._exit = Event()
+        self._thread: Thread | None = None
+        self._logger = logger.getChild(self.__class__.__name__)
+
+    def register(self, output: VoiceOutput):
+        with self._lock:
+            self._outputs = [*self._outputs, output]
+            if self._thread is None:
+                self._exit.clear()
+                self._thread = Thread(target=self._loop, name="PacedSender:Loop", daemon=True)
+                self._thread.start()
+        self.notify()
+
+    def unregister(self, output: VoiceOutput):
+        with self._lock:
+            self._outputs = [o for o in self._outputs if o is not output]
+
+    def notify(self):
+        """Wake the sender up, an output has new frames"""
+        self._wakeup.set()
+
+    def _loop(self):
+        while not self._exit.is_set():
+            self._wakeup.clear()
+            deadlines = []
+            for output in self._outputs:
+                try:
+                    deadline = output.send_due(monotonic())
+                except Exception:
+                    self._logger.error("Error while sending audio", exc_info=True)
+                    output.clear_buffer()
+                    continue
+                if deadline is not None:
+                    deadlines.append(deadline)
+            if not deadlines:
+                self._wakeup.wait()
+                continue
+            delay = min(deadlines) - monotonic()
+            if delay > 0:
+                self._wakeup.wait(delay)
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._exit.set()
+            self._wakeup.set()
+        if thread:
+            thread.join()
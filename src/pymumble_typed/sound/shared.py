@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from pymumble_typed.mumble import Mumble
+    from pymumble_typed.sound.audio import OpusPacket
+    from pymumble_typed.users import User
+
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from threading import Lock
+
+import numpy as np
+
+from pymumble_typed.sound import SAMPLE_RATE
+from pymumble_typed.sound.decoder import Decoder
+
+MAGIC = 0x504D5452  # "PMTR"
+HEADER_FIELDS = 8
+HEADER_SIZE = HEADER_FIELDS * 8
+# Header layout, every field is a native int64
+_MAGIC, _HEAD, _TAIL, _CAPACITY, _CHANNELS, _SAMPLE_RATE, _SESSION = range(7)
+
+
+class SharedPCMRing:
+    """
+    Single producer ring buffer of int16 samples living in shared memory.
+
+    Every sample is stored twice, `capacity` samples apart, so that any window of at most `capacity` samples is
+    contiguous in memory and can be handed out as a numpy view without copying. The producer moves `tail` before
+    overwriting old samples and publishes `head` after writing new ones: readers validate what they read against
+    `tail` instead of taking a lock.
+    """
+
+    def __init__(self, memory: SharedMemory):
+        self._memory = memory
+        self._header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=memory.buf)
+        if self._header[_MAGIC] != MAGIC:
+            raise ValueError(f"{memory.name} is not a PCM ring buffer")
+        self._capacity = int(self._header[_CAPACITY])
+        self._data = np.ndarray((self._capacity * 2,), dtype=np.int16, buffer=memory.buf, offset=HEADER_SIZE)
+
+    @classmethod
+    def create(cls, name: str, capacity: int, channels: int, sample_rate: int, session: int) -> SharedPCMRing:
+        size = HEADER_SIZE + capacity * 2 * 2
+        try:
+            memory = SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a process that could not unlink it, like after a crash
+            stale = SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            memory = SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=memory.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        header[_CHANNELS] = channels
+        header[_SAMPLE_RATE] = sample_rate
+        header[_SESSION] = session
+        header[_MAGIC] = MAGIC
+        del header
+        return cls(memory)
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    @property
+    def head(self) -> int:
+        return int(self._header[_HEAD])
+
+    @property
+    def tail(self) -> int:
+        return int(self._header[_TAIL])
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def channels(self) -> int:
+        return int(self._header[_CHANNELS])
+
+    @property
+    def sample_rate(self) -> int:
+        return int(self._header[_SAMPLE_RATE])
+
+    @property
+    def session(self) -> int:
+        return int(self._header[_SESSION])
+
+    def write(self, pcm: np.ndarray):
+        capacity = self._capacity
+        head = int(self._header[_HEAD]) + len(pcm)
+        if len(pcm) > capacity:
+            pcm = pcm[-capacity:]
+        size = len(pcm)
+        self._header[_TAIL] = max(0, head - capacity)
+        position = (head - size) % capacity
+        self._data[position:position + size] = pcm
+        mirror = position + capacity
+        wrap = min(size, capacity * 2 - mirror)
+        self._data[mirror:mirror + wrap] = pcm[:wrap]
+        self._data[:size - wrap] = pcm[wrap:]
+        self._header[_HEAD] = head
+
+    def view(self, start: int, end: int) -> np.ndarray:
+        position = start % self._capacity
+        return self._data[position:position + end - start]
+
+    def valid(self, start: int) -> bool:
+        return start >= int(self._header[_TAIL])
+
+    def close(self):
+        self._header = None
+        self._data = None
+        self._memory.close()
+
+    def unlink(self):
+        self._memory.unlink()
+
+
+class SharedPCMReader:
+    """Consumer side of a SharedPCMSink ring, meant to be used from another process"""
+
+    def __init__(self, name: str):
+        try:
+            memory = SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python < 3.13 registers attached segments too, and would unlink them when this process exits
+            memory = SharedMemory(name=name)
+            resource_tracker.unregister(memory._name, "shared_memory")
+        self._ring = SharedPCMRing(memory)
+        self._position = self._ring.head
+        self.overruns = 0
+
+    @property
+    def ring(self) -> SharedPCMRing:
+        return self._ring
+
+    @property
+    def position(self) -> int:
+        return self._position
+
+    def latest(self, samples: int) -> np.ndarray:
+        head = self._ring.head
+        samples = min(samples, self._ring.capacity, head)
+        return self._ring.view(head - samples, head)
+
+    def read(self) -> np.ndarray:
+        """Return a view of the samples written since the previous read, skipping ahead on overruns"""
+        head = self._ring.head
+        start = self._position
+        if not self._ring.valid(start):
+            self.overruns += 1
+            start = self._ring.tail
+        self._position = head
+        return self._ring.view(start, head)
+
+    def valid(self, view_start: int) -> bool:
+        """Check that the samples from view_start were not overwritten while they were being used"""
+        return self._ring.valid(view_start)
+
+    def close(self):
+        self._ring.close()
+
+
+class SharedPCMSink:
+    """Decode the audio received from every user into a shared memory ring buffer per user"""
+
+    def __init__(self, mumble: Mumble, prefix: str = "pymumble", duration: float = 10., channels: int = 1,
+                 on_open: Callable[[User, str], None] | None = None):
+        self._mumble = mumble
+        self._prefix = prefix
+        self._capacity = int(duration * SAMPLE_RATE) * channels
+        self._channels = channels
+        self._on_open = on_open
+        self._rings: dict[int, tuple[SharedPCMRing, Decoder]] = {}
+        self._lock = Lock()
+        self._logger = mumble.logger.getChild(self.__class__.__name__)
+        mumble.add_sound_sink(self.push)
+        mumble.add_user_removed_sink(self._user_removed)
+
+    def segment_name(self, session: int) -> str:
+        return f"{self._prefix}_{session}"
+
+    def ring(self, session: int) -> SharedPCMRing | None:
+        try:
+            return self._rings[session][0]
+        except KeyError:
+            return None
+
+    def _open(self, user: User) -> tuple[SharedPCMRing, Decoder]:
+        with self._lock:
+            # The first packets of a session may come from the UDP and the TCP receive threads at the same time
+            entry = self._rings.get(user.session)
+            if entry is not None:
+                return entry
+            ring = SharedPCMRing.create(self.segment_name(user.session), self._capacity, self._channels,
+                                        SAMPLE_RATE, user.session)
+            entry = self._rings[user.session] = (ring, Decoder(SAMPLE_RATE, self._channels))
+        self._logger.debug(f"opened shared ring {ring.name} for session {user.session}")
+        if self._on_open:
+            try:
+                self._on_open(user, ring.name)
+            except Exception:
+                self._logger.error("Error while executing shared ring callback", exc_info=True)
+        return entry
+
+    def push(self, user: User, packet: OpusPacket):
+        try:
+            ring, decoder = self._rings[user.session]
+        except KeyError:
+            ring, decoder = self._open(user)
+        pcm = decoder.decode(packet.data)
+        if pcm:
+            ring.write(np.frombuffer(pcm, dtype=np.int16))
+
+    def close_session(self, session: int):
+        with self._lock:
+            entry = self._rings.pop(session, None)
+        if entry:
+            ring, _ = entry
+            ring.close()
+            ring.unlink()
+
+    def _user_removed(self, user: User):
+        self.close_session(user.session)
+
+    def close(self):
+        self._mumble.remove_sound_sink(self.push)
+        self._mumble.remove_user_removed_sink(self._user_removed)
+        for session in list(self._rings):
+            self.close_session(session)
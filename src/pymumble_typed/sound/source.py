@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pymumble_typed.sound.voice import VoiceOutput
+
+import mmap
+from contextlib import suppress
+from struct import unpack_from
+from subprocess import DEVNULL, PIPE, Popen, TimeoutExpired
+from threading import Event, Lock
+
+import numpy as np
+
+from pymumble_typed.sound import CHANNELS, SAMPLE_RATE
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Sample format of every supported (format, bits per sample) pair
+_WAVE_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.dtype(np.uint8),
+    (WAVE_FORMAT_PCM, 16): np.dtype("<i2"),
+    (WAVE_FORMAT_PCM, 32): np.dtype("<i4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.dtype("<f4"),
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.dtype("<f8"),
+}
+
+# Played pages are released every time this many bytes have been played, keeping the resident memory constant
+RELEASE_INTERVAL = 1 << 22
+# Seconds given to a decoder process to exit once terminated, before killing it
+SHUTDOWN_TIMEOUT = 2.
+
+
+class WaveFormatError(ValueError):
+    """Thrown when a file is not a WAV file in a supported format"""
+
+
+def parse_wave_header(data: mmap.mmap | bytes) -> tuple[int, int, np.dtype, int, int]:
+    """Return sample rate, channels, sample format, offset and size of the samples of a WAV file"""
+    if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise WaveFormatError("not a RIFF/WAVE file")
+    position = 12
+    fmt: tuple[int, int, np.dtype] | None = None
+    while position + 8 <= len(data):
+        chunk_id = data[position:position + 4]
+        (chunk_size,) = unpack_from("<I", data, position + 4)
+        body = position + 8
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                raise WaveFormatError("fmt chunk is too short")
+            format_tag, channels, sample_rate, _, block_align, bits = unpack_from("<HHIIHH", data, body)
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                # The actual format is in the first two bytes of the sub-format GUID
+                (format_tag,) = unpack_from("<H", data, body + 24)
+            dtype = _WAVE_DTYPES.get((format_tag, bits))
+            if dtype is None or channels < 1 or block_align != dtype.itemsize * channels:
+                raise WaveFormatError(f"unsupported WAV format {format_tag:#06x} with {bits} bits per sample")
+            fmt = sample_rate, channels, dtype
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise WaveFormatError("data chunk before fmt chunk")
+            # Streamed files may not know the size of the data: it lasts until the end of the file
+            size = min(chunk_size, len(data) - body)
+            frame_size = fmt[2].itemsize * fmt[1]
+            return *fmt, body, size // frame_size * frame_size
+        position = body + chunk_size + (chunk_size & 1)
+    raise WaveFormatError("no data chunk")
+
+
+def is_native(output: VoiceOutput, sample_rate: int, channels: int, dtype: np.dtype) -> bool:
+    """Whether audio in this format can be queued as it is, without conversion"""
+    encoder = output.encoder
+    return dtype == np.int16 and sample_rate == encoder.sample_rate and channels == encoder.channels
+
+
+class FileSource:
+    """
+    Memory-mapped WAV or raw PCM file, played without reading it into memory.
+
+    Raw files need `sample_rate`, `channels` and `dtype`. The map is copy-on-write, so frames are handed to the
+    encoder as memoryview slices of it, without any copy, when the file already is in the encoder format.
+    """
+
+    def __init__(self, path: str, sample_rate: int | None = None, channels: int | None = None,
+                 dtype: np.dtype | str | None = None, loop: bool = False):
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        try:
+            if self._mmap[:4] == b"RIFF":
+                self.sample_rate, self.channels, self.dtype, offset, size = parse_wave_header(self._mmap)
+            else:
+                if dtype is None or channels is None:
+                    raise ValueError("channels and dtype are required for raw PCM files")
+                self.sample_rate = sample_rate or SAMPLE_RATE
+                self.channels = channels
+                self.dtype = np.dtype(dtype)
+                offset, size = 0, len(self._mmap) // (self.dtype.itemsize * channels) * self.dtype.itemsize * channels
+        except Exception:
+            self._mmap.close()
+            raise
+        with suppress(AttributeError, OSError):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        self.loop = loop
+        self._frame_size = self.dtype.itemsize * self.channels
+        self._data = memoryview(self._mmap)[offset:offset + size]
+        self._offset = offset
+        self._position = 0
+        self._released = 0
+        self._lock = Lock()
+        self._stop = Event()
+
+    @property
+    def frames(self) -> int:
+        return len(self._data) // self._frame_size
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.sample_rate
+
+    @property
+    def position(self) -> float:
+        return self._position // self._frame_size / self.sample_rate
+
+    def seek(self, seconds: float):
+        frame = min(max(int(seconds * self.sample_rate), 0), self.frames)
+        with self._lock:
+            self._position = frame * self._frame_size
+            self._released = self._position
+
+    def read(self, frames: int) -> memoryview:
+        """Return a view on the next `frames` frames, shorter at the end of the file unless looping"""
+        with self._lock:
+            if self._position >= len(self._data) and self.loop:
+                self._position = self._released = 0
+            start = self._position
+            self._position = min(start + frames * self._frame_size, len(self._data))
+            self._release(start)
+            return self._data[start:self._position]
+
+    def _release(self, position: int):
+        # Pages already played are dropped from the process, they are read back from the file when seeking back
+        if position - self._released < RELEASE_INTERVAL:
+            return
+        start = (self._offset + self._released) // mmap.PAGESIZE * mmap.PAGESIZE
+        end = (self._offset + position) // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > start:
+            with suppress(AttributeError, OSError):
+                self._mmap.madvise(mmap.MADV_DONTNEED, start, end - start)
+        self._released = position
+
+    def play(self, output: VoiceOutput, chunk: float = 0.2, ahead: float = 0.5):
+        """
+        Send the file to `output` from the current position, blocking until its end or until `stop` is called.
+
+        Chunks of `chunk` seconds are queued while the output holds less than `ahead` seconds of audio.
+        """
+        self._stop.clear()
+        native = is_native(output, self.sample_rate, self.channels, self.dtype)
+        frames = max(1, int(chunk * self.sample_rate))
+        while not self._stop.is_set():
+            if output.buffered >= ahead:
+                self._stop.wait(chunk / 2)
+                continue
+            pcm = self.read(frames)
+            if not pcm:
+                break
+            if native:
+                output.add_pcm(pcm)
+            else:
+                output.add_audio(pcm, self.sample_rate, self.channels, self.dtype)
+        if self._stop.is_set():
+            output.clear_buffer()
+        elif not native:
+            output.flush_audio()
+        output.end_transmission()
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        self.stop()
+        with suppress(BufferError):
+            self._data.release()
+        # Frames still queued by an output keep the map exported, it is then unmapped once they are collected
+        with suppress(BufferError):
+            self._mmap.close()
+
+
+class ProcessSource:
+    """
+    Audio decoded by a subprocess, like ffmpeg, and streamed from its standard output.
+
+    The output of the process is read in chunks of `chunk_size` bytes with readinto, every chunk in a new buffer whose
+    frames are queued as views, without further copies. Reading stops while the output holds `ahead` seconds of audio,
+    so the pipe applies backpressure on the process instead of the send buffer overflowing. Playback starts once
+    `prebuffer` seconds have been read, and every time the output ran dry before the end of the stream is counted in
+    `underruns`.
+    """
+
+    def __init__(self, args: list[str], sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS,
+                 dtype: np.dtype | str = np.int16, chunk_size: int = 1 << 16, prebuffer: float = 0.5,
+                 ahead: float = 1., stderr: int | None = DEVNULL):
+        self.args = args
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self._chunk_size = chunk_size
+        self._prebuffer = prebuffer
+        self._ahead = ahead
+        self._stderr = stderr
+        self._process: Popen | None = None
+        self._stop = Event()
+        self.underruns = 0
+
+    @classmethod
+    def ffmpeg(cls, source: str, sample_rate: int = SAMPLE_RATE, channels: int = CHANNELS,
+               before_options: list[str] | None = None, options: list[str] | None = None, executable: str = "ffmpeg",
+               **kwargs) -> ProcessSource:
+        """Decode any file or URL supported by ffmpeg to PCM in the given format"""
+        args = [executable, "-nostdin", "-loglevel", "error", *(before_options or []), "-i", source,
+                *(options or []), "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "pipe:1"]
+        return cls(args, sample_rate, channels, np.int16, **kwargs)
+
+    @property
+    def returncode(self) -> int | None:
+        return self._process.poll() if self._process else None
+
+    def _queue(self, output: VoiceOutput, pcm: memoryview, native: bool):
+        if native:
+            output.add_pcm(pcm)
+        else:
+            output.add_audio(pcm, self.sample_rate, self.channels, self.dtype)
+
+    def play(self, output: VoiceOutput):
+        """Run the process and send its audio to `output`, blocking until the whole stream is queued or stopped"""
+        self._stop.clear()
+        native = is_native(output, self.sample_rate, self.channels, self.dtype)
+        frame_size = self.dtype.itemsize * self.channels
+        prebuffer = int(self._prebuffer * self.sample_rate) * frame_size
+        wait = self._chunk_size / (self.sample_rate * frame_size) / 4
+        process = self._process = Popen(self.args, stdin=DEVNULL, stdout=PIPE, stderr=self._stderr, bufsize=0)
+        underruns = output.underruns
+        pending: list[memoryview] | None = []
+        pending_size = 0
+        # Pipe reads can end in the middle of a frame, the partial frame is completed by the next read
+        tail = b""
+        try:
+            while not self._stop.is_set():
+                if pending is None and output.buffered >= self._ahead:
+                    self._stop.wait(wait)
+                    continue
+                buffer = bytearray(len(tail) + self._chunk_size)
+                buffer[:len(tail)] = tail
+                read = process.stdout.readinto(memoryview(buffer)[len(tail):])
+                if not read:
+                    break
+                size = len(tail) + read
+                whole = size - size % frame_size
+                tail = bytes(buffer[whole:size])
+                if not whole:
+                    continue
+                pcm = memoryview(buffer)[:whole]
+                if pending is None:
+                    self._queue(output, pcm, native)
+                    continue
+                pending.append(pcm)
+                pending_size += whole
+                if pending_size >= prebuffer:
+                    for pcm in pending:
+                        self._queue(output, pcm, native)
+                    pending = None
+            if not self._stop.is_set():
+                for pcm in pending or []:
+                    self._queue(output, pcm, native)
+                if not native:
+                    output.flush_audio()
+        finally:
+            self._shutdown(process)
+            self.underruns += output.underruns - underruns
+            if self._stop.is_set():
+                output.clear_buffer()
+            output.end_transmission()
+
+    def _shutdown(self, process: Popen):
+        if process.poll() is None:
+            with suppress(OSError):
+                process.terminate()
+            try:
+                process.wait(SHUTDOWN_TIMEOUT)
+            except TimeoutExpired:
+                process.kill()
+                process.wait()
+        process.stdout.close()
+
+    def stop(self):
+        """Stop playing and terminate the process, dropping the audio still queued"""
+        self._stop.set()
+        if self._process and self._process.poll() is None:
+            # A read blocked on the pipe returns as soon as the process is gone
+            with suppress(OSError):
+                self._process.terminate()
@@ -1,20 +1,32 @@
+from contextlib import suppress
 from time import sleep, monotonic
-from queue import Full, Queue
+from queue import Empty, Full, Queue
+
+import numpy as np
 
 from pymumble_typed.network.control import ControlStack
 from pymumble_typed.network.udp_data import AudioData
 from pymumble_typed.network.voice import VoiceStack
-from pymumble_typed.sound import SEQUENCE_DURATION, SEQUENCE_RESET_INTERVAL
+from pymumble_typed.sound import SAMPLE_RATE, SEQUENCE_DURATION, SEQUENCE_RESET_INTERVAL
+from pymumble_typed.sound.convert import PCMConverter
 from pymumble_typed.sound.encoder import Encoder
+from pymumble_typed.sound.sender import PacedSender
+
+# Size of the packets emitted by Opus for frames dropped by the discontinuous transmission
+DTX_FRAME_SIZE = 2
+BUFFER_DURATION = 2
+# When the sender falls this many frames behind, it skips ahead instead of bursting the late frames out
+MAX_LATE_FRAMES = 5
 
 
 class VoiceOutput:
-    def __init__(self, control: ControlStack, voice: VoiceStack):
+    def __init__(self, control: ControlStack, voice: VoiceStack, sender: PacedSender | None = None, target: int = 0):
         self.positional: [int, int, int] | None = None
         self._remaining_sample: bytes = b''
         self._encoder: Encoder = Encoder(voice)
-        self._buffer: Queue[bytes] = Queue(maxsize=int(2 / self._encoder.audio_per_packet))
-        self.target: int = 0
+        # Frames to send: b"" ends the transmission, None is a silent frame that is only waited for
+        self._buffer: Queue[bytes | None] = Queue(maxsize=int(BUFFER_DURATION / self._encoder.audio_per_packet))
+        self.target: int = target
 
         self._control = control
         self._voice = voice
@@ -24,11 +36,94 @@ class VoiceOutput:
         self._sequence_last_time = 0
         self._sequence = 0
 
+        # Deadline of the next frame while transmitting, and time at which the buffer ran dry in the middle of it
+        self._next_frame: float | None = None
+        self._starved_at: float | None = None
+        self._transmitting = False
+        self._underruns = 0
+
+        self._converter: PCMConverter | None = None
+
+        self._gate_threshold: float | None = None
+        self._hangover = 0.2
+        self._silent_frames = 0
+        self._gated = True
+
+        self._sender = sender or PacedSender(voice.logger)
+        self._sender.register(self)
+
+    @property
+    def buffered(self) -> float:
+        """Seconds of audio queued and not sent yet"""
+        return self._buffer.qsize() * self._encoder.audio_per_packet
+
+    @property
+    def capacity(self) -> float:
+        return self._buffer.maxsize * self._encoder.audio_per_packet
+
+    @property
+    def underruns(self) -> int:
+        """Times the buffer ran dry in the middle of a transmission, leaving a gap in the audio"""
+        return self._underruns
+
+    @property
+    def silence_threshold(self) -> float | None:
+        """Level in dBFS below which frames are considered silent and not sent, None disables the gate"""
+        if self._gate_threshold is None:
+            return None
+        return 10 * np.log10(self._gate_threshold / 32768 ** 2)
+
+    @silence_threshold.setter
+    def silence_threshold(self, threshold: float | None):
+        # Stored as the mean square of the int16 samples, to compare it with the frames energy directly
+        self._gate_threshold = None if threshold is None else 32768 ** 2 * 10 ** (threshold / 10)
+
+    @property
+    def hangover(self) -> float:
+        """Seconds of silence still sent after the audio stops, to avoid cutting the tail of words"""
+        return self._hangover
+
+    @hangover.setter
+    def hangover(self, hangover: float):
+        self._hangover = hangover
+
     # Legacy code support
     def add_sound(self, pcm: bytes):
         self.add_pcm(pcm)
 
-    def add_pcm(self, pcm: bytes):
+    def _get_converter(self, sample_rate: int, channels: int, dtype: np.dtype) -> PCMConverter:
+        converter = self._converter
+        if (converter is None or converter.sample_rate != sample_rate or converter.channels != channels
+                or converter.dtype != dtype or converter.dst_sample_rate != self._encoder.sample_rate
+                or converter.dst_channels != self._encoder.channels):
+            converter = self._converter = PCMConverter(sample_rate, channels, dtype, self._encoder.sample_rate,
+                                                       self._encoder.channels)
+        return converter
+
+    def add_audio(self, data: np.ndarray | bytes | bytearray | memoryview, sample_rate: int = SAMPLE_RATE,
+                  channels: int | None = None, dtype: np.dtype | str | None = None):
+        """
+        Send audio in any format, converting it to the encoder's one.
+
+        `data` is an array shaped (frames,) or (frames, channels), or a buffer of interleaved samples of `dtype`
+        (int16 by default). The conversion state is kept between calls with the same format, so a stream can be
+        passed in chunks of any size. Call `flush_audio` once the stream is over to send its last samples.
+        """
+        if isinstance(data, np.ndarray):
+            dtype = data.dtype if dtype is None else dtype
+            channels = channels or (data.shape[1] if data.ndim > 1 else 1)
+        converter = self._get_converter(sample_rate, channels or self._encoder.channels, np.dtype(dtype or np.int16))
+        pcm = converter.process(data)
+        if pcm:
+            self.add_pcm(pcm)
+
+    def flush_audio(self):
+        if self._converter:
+            pcm = self._converter.flush()
+            if pcm:
+                self.add_pcm(pcm)
+
+    def add_pcm(self, pcm: bytes | memoryview):
         if len(pcm) % 2 != 0:
             raise ValueError("pcm data must be 16 bits")
         if not self._control.is_connected():
@@ -37,19 +132,59 @@ class VoiceOutput:
 
         # Discard the remaining sample if too much time has passed from the previous sent.
         # This should avoid adding delay to the audio sent or sending audio out of order.
-        if monotonic() - self._sequence_last_time <= self._encoder.audio_per_packet:
+        if self._remaining_sample and (self._buffer.qsize() > 0
+                                       or monotonic() - self._sequence_last_time <= self._encoder.audio_per_packet):
             pcm = self._remaining_sample + pcm
         self._remaining_sample = b''
 
         offset = len(pcm) // samples
         processed = offset * samples
+        frames = [pcm[i:i + samples] for i in range(0, processed, samples)]
+        if self._gate_threshold is not None and offset:
+            frames = self._gate(pcm[:processed], frames)
         try:
-            for i in range(0, processed, samples):
-                self._buffer.put(pcm[i:i + samples], block=False)
-            self._remaining_sample = pcm[processed:]
+            for frame in frames:
+                # Producers faster than real time wait here for the sender to make room
+                self._buffer.put(frame, timeout=BUFFER_DURATION)
+                self._sender.notify()
+            self._remaining_sample = bytes(pcm[processed:])
         except Full:
             self._logger.warning(f"Buffer is full! Dropping audio packet!")
-        self.send_audio()
+
+    def end_transmission(self):
+        """Send the audio still held back and a terminator, telling listeners that the transmission is over"""
+        if self._gate_threshold is not None and self._gated:
+            # The gate already ended it
+            return
+        frames = [self._remaining_sample, b""] if self._remaining_sample else [b""]
+        self._remaining_sample = b''
+        try:
+            for frame in frames:
+                self._buffer.put(frame, timeout=BUFFER_DURATION)
+                self._sender.notify()
+        except Full:
+            self._logger.warning("Buffer is full! Dropping audio packet!")
+
+    def _gate(self, pcm: bytes, frames: list[bytes]) -> list[bytes | None]:
+        samples = np.frombuffer(pcm, dtype=np.int16).reshape(len(frames), -1).astype(np.float32)
+        silent = (np.square(samples).mean(axis=1) < self._gate_threshold).tolist()
+        hangover = int(self._hangover / self._encoder.audio_per_packet)
+        gated: list[bytes | None] = []
+        for frame, is_silent in zip(frames, silent):
+            if not is_silent:
+                self._silent_frames = 0
+                self._gated = False
+                gated.append(frame)
+            elif self._gated:
+                gated.append(None)
+            else:
+                self._silent_frames += 1
+                if self._silent_frames > hangover:
+                    self._gated = True
+                    gated.append(b"")
+                else:
+                    gated.append(frame)
+        return gated
 
     def _update_sequence(self):
         audio_per_packet = self._encoder.audio_per_packet
@@ -68,30 +203,79 @@ class VoiceOutput:
             self._sequence_last_time = self._sequence_start_time + (self._sequence * SEQUENCE_DURATION)
 
     def clear_buffer(self):
-        self._buffer = Queue(maxsize=int(2 / self._encoder.audio_per_packet))
+        maxsize = int(BUFFER_DURATION / self._encoder.audio_per_packet)
+        if self._buffer.maxsize != maxsize:
+            self._buffer = Queue(maxsize=maxsize)
+        with suppress(Empty):
+            while True:
+                self._buffer.get(block=False)
 
     def send_audio(self):
-        if not self._buffer.qsize() > 0:
-            return
+        """Wait until all the queued audio has been sent"""
         while self._buffer.qsize() > 0 and self._control.is_connected():
-            audio_per_packet = self._encoder.audio_per_packet
-            self._update_sequence()
-            audio = AudioData()
-            audio_encoded = 0
-            while self._buffer.qsize() > 0 and audio_encoded < audio_per_packet:
-                pcm = self._buffer.get(block=False)
-                encoded = self._encoder.encode(pcm)
+            sleep(self._encoder.audio_per_packet)
+
+    def send_due(self, now: float) -> float | None:
+        """Send the next frame if its time has come, returning the deadline of the following one, None when idle"""
+        audio_per_packet = self._encoder.audio_per_packet
+        if not self._control.is_connected():
+            self.clear_buffer()
+        if self._buffer.empty():
+            if self._next_frame is not None and now >= self._next_frame:
+                self._next_frame = None
+                # Running dry after a terminator or gated silence is the expected end of a transmission
+                self._starved_at = now if self._transmitting else None
+            return self._next_frame
+        if self._next_frame is None:
+            if self._starved_at is not None and now - self._starved_at < SEQUENCE_RESET_INTERVAL:
+                self._underruns += 1
+                self._logger.warning(f"send buffer underrun, audio interrupted for {now - self._starved_at:.3f}s")
+            self._starved_at = None
+            self._next_frame = now
+        elif now < self._next_frame:
+            return self._next_frame
+        elif now - self._next_frame > audio_per_packet * MAX_LATE_FRAMES:
+            self._logger.warning(f"sender is late by {now - self._next_frame:.3f}s, skipping ahead")
+            self._next_frame = now
+        self.send_frame()
+        self._next_frame += audio_per_packet
+        return self._next_frame
+
+    def send_frame(self):
+        """Encode and send the next queued frame"""
+        pcm = self._buffer.get(block=False)
+        self._transmitting = bool(pcm)
+        if pcm is None:
+            # Gated silence keeps the pace without being encoded nor sent, so the sequence of the next
+            # transmission is computed by _update_sequence from the time actually elapsed
+            return
+        audio_per_packet = self._encoder.audio_per_packet
+        self._update_sequence()
+        audio = AudioData()
+        audio_encoded = 0
+        while pcm is not None:
+            if not pcm:
+                audio.is_terminator = True
+                break
+            encoded = self._encoder.encode(pcm)
+            audio_encoded += self._encoder.encoder_framesize
+            if not self._encoder.dtx or len(encoded) > DTX_FRAME_SIZE:
                 audio.add_chunk(encoded)
-                audio_encoded += self._encoder.encoder_framesize
-            audio.target = self.target
-            audio.sequence = self._sequence
-            audio.positional = self.positional
+            pcm = None
+            if self._buffer.qsize() > 0 and audio_encoded < audio_per_packet:
+                pcm = self._buffer.get(block=False)
+        audio.target = self.target
+        audio.sequence = self._sequence
+        audio.positional = self.positional
+        if not audio.empty or audio.is_terminator:
             self._voice.send_packet(audio)
-            delay = audio_per_packet - (monotonic() - self._sequence_last_time)
-            if delay >= 0:
-                sleep(delay)
-            else:
-                self._logger.warning(f"delay is negative: {delay}!")
+        if audio.is_terminator:
+            self._encoder.reset()
+
+    def close(self):
+        self._sender.unregister(self)
+        self.clear_buffer()
+        self._encoder.close()
 
     @property
     def encoder(self):
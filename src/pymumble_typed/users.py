@@ -3,6 +3,8 @@ from __future__ import annotations
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
+    from concurrent.futures import Future
+
     from pymumble_typed.blobs import BlobDB
     from pymumble_typed.channels import Channel
     from pymumble_typed.mumble import Mumble
@@ -11,15 +13,23 @@ if TYPE_CHECKING:
 from contextlib import suppress
 from threading import Lock
 
-from pymumble_typed.commands import ModUserState, Move, RemoveUser, RequestBlobCmd, TextPrivateMessage
+from pymumble_typed.blob_requests import BlobKind, resolved
+from pymumble_typed.commands import ModUserState, Move, RemoveUser, TextPrivateMessage
+from pymumble_typed.snapshot import UserSnapshot
 
 
 class User:
-    def __init__(self, mumble: Mumble, blob: BlobDB, packet: UserState):
+    # Slotted, with comment and texture kept in the blob database and read on access, to keep large servers cheap
+    __slots__ = ("_blob", "_comment_hash", "_mumble", "_texture_hash", "channel_id", "deaf", "hash", "is_recording",
+                 "muted", "name", "priority_speaker", "self_deaf", "self_muted", "session", "suppressed", "user_id")
+
+    def __init__(self, mumble: Mumble, blob: BlobDB, packet: UserState, store_blobs: bool = True):
         self._mumble: Mumble = mumble
         self._blob = blob
         self.hash: str = packet.hash
         self.session: int = packet.session
+        # Id of the registered account, -1 for unregistered users
+        self.user_id: int = packet.user_id if packet.HasField("user_id") else -1
         self.name = packet.name
         self.priority_speaker = packet.priority_speaker
         self.channel_id: int = packet.channel_id
@@ -31,23 +41,43 @@ class User:
         self.is_recording = packet.recording
 
         self._comment_hash = packet.comment_hash
-        self.comment = packet.comment
-        if not (packet.HasField("comment") or packet.HasField("comment_hash")):
-            self._blob.update_user_comment(self.hash, "", "")
-        elif self._blob.is_user_comment_updated(self.hash, self._comment_hash.hex()):
-            self.comment = self._blob.get_user_comment(self.hash)
-
         self._texture_hash = packet.texture_hash
-        self.texture = packet.texture
-        if not (packet.HasField("texture") or packet.HasField("texture_hash")):
-            self._blob.update_user_comment(self.hash, "", "")
-        elif self._blob.is_user_texture_updated(self.hash, self._texture_hash.hex()):
-            self.texture = self._blob.get_user_texture(self.hash)
-        self._users = self._mumble.users
+        if store_blobs:
+            comment, texture = self._initial_blobs(packet)
+            if comment:
+                self._blob.update_user_comment(*comment)
+            if texture:
+                self._blob.update_user_texture(*texture)
         if self._mumble.ready:
             self.request_comment()
             self.request_texture()
 
+    def _initial_blobs(self, packet: UserState) -> tuple[tuple[str, str, str] | None, tuple[str, str, bytes] | None]:
+        # Blobs sent along with a new user, or empty ones when it has none
+        comment = texture = None
+        if packet.HasField("comment"):
+            comment = self._blob_key, self._comment_hash.hex(), packet.comment
+        elif not packet.HasField("comment_hash"):
+            comment = self._blob_key, "", ""
+        if packet.HasField("texture"):
+            texture = self._blob_key, self._texture_hash.hex(), packet.texture
+        elif not packet.HasField("texture_hash"):
+            texture = self._blob_key, "", b""
+        return comment, texture
+
+    @property
+    def _blob_key(self) -> str:
+        # Users without a certificate have no hash, their blobs are kept per session
+        return self.hash or f"session:{self.session}"
+
+    @property
+    def comment(self) -> str:
+        return self._blob.get_user_comment(self._blob_key)
+
+    @property
+    def texture(self) -> bytes:
+        return self._blob.get_user_texture(self._blob_key)
+
     @property
     def avatar_hash(self) -> bytes:
         return self._texture_hash
@@ -68,33 +98,43 @@ class User:
         return not (self.is_comment_updated() and self.is_avatar_updated())
 
     def is_comment_updated(self):
-        return ((not self.comment) == (not self._comment_hash)) or self._blob.is_user_comment_updated(
-            self.hash, self._comment_hash.hex()
-        )
+        # Without a hash the comment, if any, was sent along with the user state and is already stored
+        return not self._comment_hash or self._blob.is_user_comment_updated(self._blob_key, self._comment_hash.hex())
 
     def is_avatar_updated(self):
-        return ((not self.texture) == (not self._texture_hash)) or self._blob.is_user_texture_updated(
-            self.hash, self._texture_hash.hex()
-        )
+        return not self._texture_hash or self._blob.is_user_texture_updated(self._blob_key, self._texture_hash.hex())
+
+    def fetch_comment(self) -> Future[str]:
+        """
+        Comment of the user, requested to the server only if the stored one is missing or outdated.
+
+        The Future is resolved when the comment is received, and at once when it is already stored. It can be awaited
+        with asyncio.wrap_future.
+        """
+        if self.is_comment_updated():
+            return resolved(self.comment)
+        return self._mumble.blob_requests.fetch(BlobKind.COMMENT, self.session)
+
+    def fetch_texture(self) -> Future[bytes]:
+        """Avatar of the user, requested to the server only if missing or outdated, see fetch_comment"""
+        if self.is_avatar_updated():
+            return resolved(self.texture)
+        return self._mumble.blob_requests.fetch(BlobKind.TEXTURE, self.session)
 
     def request_comment(self):
         if not self._comment_hash:
             return
         if self._mumble.blob_greedy_update and not self.is_comment_updated():
             self._update_comment()
-        else:
-            self.comment = self._blob.get_user_comment(self.hash)
 
     def request_texture(self):
         if not self._texture_hash:
             return
         if self._mumble.blob_greedy_update and not self.is_avatar_updated():
             self._update_texture()
-        else:
-            self.texture = self._blob.get_user_texture(self.hash)
 
     def myself(self):
-        return self._users.myself.session == self.session
+        return self._mumble.users.myself.session == self.session
 
     def update(self, packet: UserState):
         actions = {}
@@ -104,6 +144,9 @@ class User:
         if packet.HasField("name") and self.name != packet.name:
             actions["name"] = self.name
             self.name = packet.name
+        if packet.HasField("user_id") and self.user_id != packet.user_id:
+            actions["user_id"] = self.user_id
+            self.user_id = packet.user_id
         if packet.HasField("priority_speaker") and self.priority_speaker != packet.priority_speaker:
             actions["priority_speaker"] = self.priority_speaker
             self.priority_speaker = packet.priority_speaker
@@ -128,42 +171,39 @@ class User:
             return None
         if packet.HasField("comment"):
             actions["comment"] = self.comment
-            self.comment = packet.comment
-            if not self.comment:
+            if not packet.comment:
                 self._comment_hash = b""
-                self._blob.update_user_comment(self.hash, self._comment_hash.hex(), self.comment)
-            if self._comment_hash:
-                self._blob.update_user_comment(self.hash, self._comment_hash.hex(), self.comment)
+            self._blob.update_user_comment(self._blob_key, self._comment_hash.hex(), packet.comment)
         if packet.HasField("texture_hash"):
             self._texture_hash = packet.texture_hash
             self.request_texture()
             return None
         if packet.HasField("texture"):
             actions["texture"] = self.texture
-            actions["avatar"] = self.texture
-            self.texture = packet.texture
-            if not self.texture:
+            actions["avatar"] = actions["texture"]
+            if not packet.texture:
                 self._texture_hash = b""
-                self._blob.update_user_texture(self.hash, self._texture_hash.hex(), self.texture)
-            if self._texture_hash:
-                self._blob.update_user_texture(self.hash, self._texture_hash.hex(), self.texture)
+            self._blob.update_user_texture(self._blob_key, self._texture_hash.hex(), packet.texture)
 
         return actions
 
     def channel(self):
         return self._mumble.channels[self.channel_id]
 
+    def snapshot(self) -> UserSnapshot:
+        return UserSnapshot(self.session, self.name, self.hash, self.channel_id, self.priority_speaker, self.muted,
+                            self.self_muted, self.deaf, self.self_deaf, self.suppressed, self.is_recording,
+                            self._comment_hash, self._texture_hash)
+
     def _update_comment(self):
         if not self._comment_hash:
             return
-        cmd = RequestBlobCmd(user_comment_hashes=[self.session])
-        self._mumble.execute_command(cmd, False)
+        self._mumble.blob_requests.request_comment(self.session)
 
     def _update_texture(self):
         if not self._texture_hash:
             return
-        cmd = RequestBlobCmd(user_texture_hashes=[self.session])
-        self._mumble.execute_command(cmd, False)
+        self._mumble.blob_requests.request_texture(self.session)
 
     def mute(self, myself: bool = False, action: bool = True):
         if self.myself() and myself:
@@ -276,27 +316,63 @@ class Users(dict[int, User]):
         self._blob = blob
         self._myself_session = None
         self._lock = Lock()
+        # Secondary indexes, only changed under the lock. Lookups do not take it: reading a dict or copying a set are
+        # atomic in CPython
+        self._by_channel: dict[int, set[int]] = {}
+        self._by_name: dict[str, int] = {}
+        self._by_hash: dict[str, int] = {}
+        # Sessions changed since the last snapshot, None while snapshots are not in use
+        self._changed: set[int] | None = None
         self._logger = mumble.logger.getChild(self.__class__.__name__)
 
+    def _index(self, user: User):
+        self._by_channel.setdefault(user.channel_id, set()).add(user.session)
+        self._by_name[user.name.lower()] = user.session
+        if user.hash:
+            self._by_hash[user.hash] = user.session
+
+    def _unindex(self, session: int, channel_id: int, name: str, _hash: str):
+        members = self._by_channel.get(channel_id)
+        if members is not None:
+            members.discard(session)
+            if not members:
+                del self._by_channel[channel_id]
+        # Another user with the same name or certificate may have been indexed later
+        if self._by_name.get(name.lower()) == session:
+            del self._by_name[name.lower()]
+        if _hash and self._by_hash.get(_hash) == session:
+            del self._by_hash[_hash]
+
     def handle_update(self, packet: UserState):
         with self._lock:
-            try:
-                user = self[packet.session]
-                # FIXME(nico9889): packet.session should be removed and a null actor passed.
-                #  It's currently reported back as a self-update to avoid breaking changes
-                actor = self[packet.actor or packet.session]
-                before = user.update(packet)
-                # Avoid calling callback if no modification has been registered (like for hashes)
-                if self._mumble.blob_greedy_update and not before:
-                    return
-                self._mumble.callbacks.dispatch("on_user_updated", user, actor, before)
-            except KeyError:
+            user = self.get(packet.session)
+            if user is None:
                 user = User(self._mumble, self._blob, packet)
                 self[packet.session] = user
+                self._index(user)
+                if self._changed is not None:
+                    self._changed.add(user.session)
                 if packet.session != self._myself_session:
                     self._mumble.callbacks.dispatch("on_user_created", user)
                 else:
                     self.myself = user
+                return
+            # FIXME(nico9889): packet.session should be removed and a null actor passed.
+            #  It's currently reported back as a self-update to avoid breaking changes
+            # An actor unknown to us, like one that already left, is reported as the user itself
+            actor = self.get(packet.actor or packet.session, user)
+            indexed = user.session, user.channel_id, user.name, user.hash
+            before = user.update(packet)
+            self._mumble.permissions.invalidate_user(user.session)
+            if self._changed is not None:
+                self._changed.add(user.session)
+            if indexed != (user.session, user.channel_id, user.name, user.hash):
+                self._unindex(*indexed)
+                self._index(user)
+            # Avoid calling callback if no modification has been registered (like for hashes)
+            if self._mumble.blob_greedy_update and not before:
+                return
+            self._mumble.callbacks.dispatch("on_user_updated", user, actor, before)
 
     def remove(self, packet: UserRemove):
         with self._lock:
@@ -307,10 +383,93 @@ class Users(dict[int, User]):
                 except KeyError:
                     actor = user
                 del self[packet.session]
+                self._mumble.permissions.invalidate_user(user.session)
+                self._unindex(user.session, user.channel_id, user.name, user.hash)
+                if self._changed is not None:
+                    self._changed.add(user.session)
                 self._mumble.callbacks.dispatch("on_user_removed", user, actor, packet.ban, packet.reason)
             except KeyError:
                 self._logger.warning(f"cannot remove user {packet.session}: user do not exist")
 
+    def clear(self):
+        with self._lock:
+            if self._changed is not None:
+                self._changed.update(self)
+            super().clear()
+            self._by_channel = {}
+            self._by_name = {}
+            self._by_hash = {}
+
+    def load(self, packets: dict[int, list[UserState]]):
+        """
+        Apply at once the users received before ServerSync, by session. Their blobs are stored with one transaction
+        and no created event is dispatched, the client emits on_synced instead.
+        """
+        comments, textures = [], []
+        with self._lock:
+            for session, updates in packets.items():
+                user = self.get(session)
+                if user is None:
+                    user = User(self._mumble, self._blob, updates[0], store_blobs=False)
+                    comment, texture = user._initial_blobs(updates[0])
+                    comments += [comment] if comment else []
+                    textures += [texture] if texture else []
+                    self[session] = user
+                    updates = updates[1:]
+                else:
+                    self._unindex(user.session, user.channel_id, user.name, user.hash)
+                for packet in updates:
+                    user.update(packet)
+                self._index(user)
+                if self._changed is not None:
+                    self._changed.add(session)
+        self._mumble.permissions.invalidate()
+        self._blob.update_user_blobs(comments, textures)
+
+    def outdated_blobs(self) -> tuple[list[int], list[int]]:
+        """Sessions of the users whose stored comment and texture are missing or stale, with one query"""
+        users = list(self.values())
+        stored = self._blob.get_user_blob_hashes(list({user._blob_key for user in users}))
+        comments, textures = [], []
+        for user in users:
+            # Same rule as is_comment_updated and is_avatar_updated: without a hash there is nothing to request
+            comment_hash, texture_hash = stored.get(user._blob_key, (None, None))
+            if user._comment_hash and comment_hash != user._comment_hash.hex():
+                comments.append(user.session)
+            if user._texture_hash and texture_hash != user._texture_hash.hex():
+                textures.append(user.session)
+        return comments, textures
+
+    def track_changes(self):
+        """Start recording the changed sessions for take_changes, every current user counts as changed"""
+        with self._lock:
+            self._changed = set(self)
+
+    def take_changes(self) -> dict[int, UserSnapshot | None] | None:
+        """Snapshots of the users changed since the previous call, None for the removed ones"""
+        with self._lock:
+            if not self._changed:
+                return None
+            changed, self._changed = self._changed, set()
+            return {session: self[session].snapshot() if session in self else None for session in changed}
+
+    def in_channel(self, channel_id: int) -> list[User]:
+        """Users in the channel, without scanning the whole server"""
+        return [self[session] for session in list(self._by_channel.get(channel_id, ())) if session in self]
+
+    def sessions_in_channel(self, channel_id: int) -> set[int]:
+        return set(self._by_channel.get(channel_id, ()))
+
+    def by_name(self, name: str) -> User | None:
+        """User with this name, ignoring case"""
+        session = self._by_name.get(name.lower())
+        return None if session is None else self.get(session)
+
+    def by_hash(self, _hash: str) -> User | None:
+        """User connected with the certificate having this hash"""
+        session = self._by_hash.get(_hash)
+        return None if session is None else self.get(session)
+
     def set_myself(self, session: int):
         self._myself_session = session
         with suppress(KeyError):
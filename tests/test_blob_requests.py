@@ -0,0 +1,157 @@
+from logging import getLogger
+from queue import Queue
+
+import pytest
+
+from pymumble_typed.blob_requests import ESTIMATED_SIZES, BlobKind, BlobRequestScheduler, BlobUnavailableError
+
+
+class FakeControl:
+    def __init__(self):
+        self.msg_queue = Queue()
+        self.sent = []
+
+    def send_command(self, command):
+        packet = command.packet
+        self.sent.append((list(packet.session_comment), list(packet.session_texture),
+                          list(packet.channel_description)))
+
+
+class FakePolicy:
+    def __init__(self):
+        self.tokens = 0
+
+    def paused(self, now: float) -> bool:
+        return False
+
+    def priority(self, kind: BlobKind, _id: int, now: float) -> int:
+        return _id
+
+    def available(self, now: float, size: int) -> bool:
+        return True
+
+    def consume(self, size: int):
+        self.tokens -= size
+
+    def credit(self, size: int):
+        self.tokens += size
+
+
+@pytest.fixture
+def control() -> FakeControl:
+    return FakeControl()
+
+
+@pytest.fixture
+def scheduler(control):
+    # The window is long enough for the timer never to fire, flush() is called by the tests
+    scheduler = BlobRequestScheduler(control, getLogger(), window=3600.)
+    yield scheduler
+    scheduler.stop()
+
+
+def test_requests_are_deduplicated(scheduler, control):
+    scheduler.request(BlobKind.COMMENT, [1, 2, 1])
+    scheduler.request_comment(2)
+    scheduler.request_texture(1)
+    assert scheduler.pending == 3
+    scheduler.flush()
+    assert control.sent == [([1, 2], [1], [])]
+    # Already requested and not received yet
+    scheduler.request(BlobKind.COMMENT, [1, 2])
+    assert scheduler.pending == 0
+    scheduler.flush()
+    assert len(control.sent) == 1
+
+
+def test_outstanding_bytes(scheduler, control):
+    scheduler.request(BlobKind.COMMENT, [1])
+    scheduler.request(BlobKind.DESCRIPTION, [3])
+    scheduler.flush()
+    assert scheduler.outstanding == ESTIMATED_SIZES[BlobKind.COMMENT] + ESTIMATED_SIZES[BlobKind.DESCRIPTION]
+    scheduler.received(BlobKind.COMMENT, 1, "comment")
+    assert scheduler.outstanding == ESTIMATED_SIZES[BlobKind.DESCRIPTION]
+    scheduler.forget_channel(3)
+    assert scheduler.outstanding == 0
+    # Received without being requested
+    scheduler.received(BlobKind.COMMENT, 4, "comment")
+    assert scheduler.outstanding == 0
+
+
+def test_max_outstanding(control):
+    scheduler = BlobRequestScheduler(control, getLogger(), window=3600.,
+                                     max_outstanding=ESTIMATED_SIZES[BlobKind.TEXTURE])
+    try:
+        scheduler.request(BlobKind.TEXTURE, [1, 2])
+        scheduler.flush()
+        assert control.sent == [([], [1], [])]
+        scheduler.flush()
+        assert len(control.sent) == 1
+        scheduler.received(BlobKind.TEXTURE, 1, b"\0" * ESTIMATED_SIZES[BlobKind.TEXTURE])
+        scheduler.flush()
+        assert control.sent[1] == ([], [2], [])
+    finally:
+        scheduler.stop()
+
+
+def test_estimates_follow_received_sizes(scheduler, control):
+    policy = FakePolicy()
+    scheduler.set_policy(policy)
+    scheduler.request(BlobKind.TEXTURE, [1])
+    scheduler.flush()
+    assert policy.tokens == -ESTIMATED_SIZES[BlobKind.TEXTURE]
+    scheduler.received(BlobKind.TEXTURE, 1, b"\0" * 1000)
+    # The budget is charged with the real size
+    assert policy.tokens == -1000
+    scheduler.request(BlobKind.TEXTURE, [2])
+    scheduler.flush()
+    assert scheduler.outstanding < ESTIMATED_SIZES[BlobKind.TEXTURE]
+
+
+def test_fetch(scheduler, control):
+    future = scheduler.fetch(BlobKind.DESCRIPTION, 3)
+    scheduler.flush()
+    assert control.sent == [([], [], [3])]
+    scheduler.received(BlobKind.DESCRIPTION, 3, "description")
+    assert future.result(0) == "description"
+
+
+def test_fetch_is_asked_again_on_timeout(control):
+    scheduler = BlobRequestScheduler(control, getLogger(), window=3600., timeout=0.)
+    try:
+        scheduler.fetch(BlobKind.COMMENT, 1)
+        scheduler.request(BlobKind.COMMENT, [2])
+        scheduler.flush()
+        scheduler.flush()
+        # Only the fetched blob is asked again, the prefetched one is just dropped
+        assert control.sent == [([1, 2], [], []), ([1], [], [])]
+    finally:
+        scheduler.stop()
+
+
+def test_fetch_ignores_queued_commands(scheduler, control):
+    scheduler.set_policy(FakePolicy())
+    control.msg_queue.put(object())
+    scheduler.request(BlobKind.COMMENT, [1])
+    future = scheduler.fetch(BlobKind.COMMENT, 2)
+    scheduler.flush()
+    assert control.sent == [([2], [], [])]
+    control.msg_queue.get()
+    scheduler.flush()
+    assert control.sent[1] == ([1], [], [])
+    assert not future.done()
+
+
+def test_forget_fails_the_waiters(scheduler):
+    future = scheduler.fetch(BlobKind.TEXTURE, 1)
+    scheduler.forget_user(1)
+    with pytest.raises(BlobUnavailableError):
+        future.result(0)
+    assert scheduler.pending == 0
+
+
+def test_cancelled_fetch(scheduler, control):
+    future = scheduler.fetch(BlobKind.COMMENT, 1)
+    future.cancel()
+    scheduler.received(BlobKind.COMMENT, 1, "comment")
+    assert future.cancelled()